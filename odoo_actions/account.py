@@ -78,7 +78,7 @@ class UpdateAccountDetailsAction(BaseAction, ResourceMixin, OdooMixin):
             partner.street2 != self.address_2,
             partner.city != self.city,
             partner.zip != self.postal_code,
-            partner.country_id != self.country_id,
+            partner.country_id.id != self.country_id.id,
         ])
 
         message_str = ""
@@ -99,19 +99,16 @@ class UpdateAccountDetailsAction(BaseAction, ResourceMixin, OdooMixin):
 
         odooclient.partners.add_internal_note(partner.id, message_str)
 
-        # Turn auto_commit off briefy to increase speed
-        odooclient._odoorpc.config['auto_commit'] = False
-        partner.name = self.name
-        partner.street = self.address_1
-        partner.street2 = self.address_2
-        partner.city = self.city
-        partner.zip = self.postal_code
-        partner.country_id = self.country_id
+        odooclient.partners.write(partner.id, {
+            'name': self.name,
+            'street': self.address_1,
+            'street2': self.address_2,
+            'city': self.city,
+            'zip': self.postal_code,
+            'country_id': self.country_id.id,
+        }, current=partner)
 
-        self.add_note("Updated address of partner '%s'" % partner.name)
-        partner.env.commit()
-
-        odooclient._odoorpc.config['auto_commit'] = True
+        self.add_note("Updated address of partner '%s'" % self.name)
 
     def _update_fiscal_position(self, partner):
         """Update fiscal position on partner
@@ -121,16 +118,21 @@ class UpdateAccountDetailsAction(BaseAction, ResourceMixin, OdooMixin):
             - self.fiscal_position_id
         """
         if self.country_change:
+            odooclient = odoo_client.get_odoo_client()
             if self._check_fiscal_position():
                 if self.fiscal_position_id:
                     self.add_note("Setting fiscal position")
-                    partner.property_account_position = \
-                        self.fiscal_position_id
+                    odooclient.partners.write(partner.id, {
+                        odooclient.partners.fiscal_position_field:
+                            self.fiscal_position_id,
+                    }, only_changed=False)
                 else:
                     self.add_note("Fiscal position tag not defined")
             else:
                 self.add_note("Fiscal position now set to false.")
-                partner.property_account_position = False
+                odooclient.partners.write(partner.id, {
+                    odooclient.partners.fiscal_position_field: False,
+                }, only_changed=False)
 
     # TODO(adriant): make sure the API GET returns if is root project so
     # the gui can hide the edit buttom
@@ -219,8 +221,11 @@ class UpdateAccountDetailsAction(BaseAction, ResourceMixin, OdooMixin):
         if self.action.valid:
             self.add_note("Updating billing address")
             address_contact = self.odoo_owner
-            self._update_partner(address_contact)
-            self._update_fiscal_position(address_contact)
+            odooclient = odoo_client.get_odoo_client()
+            # Sends the address and fiscal position in one write.
+            with odooclient.transaction():
+                self._update_partner(address_contact)
+                self._update_fiscal_position(address_contact)
 
     def submit(self, data):
         # Nothing to do here, all done at post_approve
@@ -36,7 +36,9 @@ class OdooMixin(object):
         odooclient = odoo_client.get_odoo_client()
         try:
             search = [['tenant_id', '=', self.project_id]]
-            project = odooclient.projects.list(search)[0]
+            project_id = odooclient.projects.list(
+                search, get=False, limit=1)[0]
+            project = odooclient.projects.get(project_id)[0]
             self.odoo_project = project
             self.odoo_project_id = project.id
             self.odoo_project_name = project.name
@@ -84,7 +86,8 @@ class OdooMixin(object):
             ['cloud_tenant', '=', self.odoo_project_id],
             ['contact_type', '=', 'owner']
         ]
-        all_relations = odooclient.project_relationships.list(search)
+        all_relations = odooclient.project_relationships.list(
+            search, get=False)
         if len(all_relations) > 1:
             note = ("WARNING! More than one owner found for '%s'"
                     % self.project_id)
@@ -103,7 +106,9 @@ class OdooMixin(object):
                 self.set_cache('no_owner_error', True)
             return None
 
-        self.odoo_owner = all_relations[0].partner_id
+        owner_relation = odooclient.project_relationships.get(
+            all_relations[0])[0]
+        self.odoo_owner = owner_relation.partner_id
         self.add_note("Found owner: %s" % self.odoo_owner.name)
         return self.odoo_owner.id
 
@@ -121,8 +126,9 @@ class OdooMixin(object):
         if not getattr(self, 'project_owner', None):
             odooclient = odoo_client.get_odoo_client()
 
+            # We only need to know if there is more than one.
             projects = odooclient.projects.list(
-                [('tenant_id', '=', self.project_id)])
+                [('tenant_id', '=', self.project_id)], get=False, limit=2)
             if len(projects) == 0:
                 raise OdooModelsIncorrect(
                     'Project "%s" is not set up in OpenERP.' % self.project_id)
@@ -131,13 +137,13 @@ class OdooMixin(object):
                     'More than one project "%s" is set up in OpenERP.'
                     % self.project_id)
 
-            self.odoo_project = projects[0]
+            self.odoo_project = odooclient.projects.get(projects[0])[0]
             self.add_note("Odoo Project ID: %s" % self.odoo_project.id)
 
             project_rels = odooclient.project_relationships.list([
                 ('cloud_tenant', '=', self.odoo_project.id),
                 ('contact_type', '=', 'owner'),
-            ])
+            ], get=False, limit=2)
 
             if len(project_rels) == 0:
                 raise OdooModelsIncorrect(
@@ -146,7 +152,8 @@ class OdooMixin(object):
                 raise OdooModelsIncorrect(
                     'Project "%s" has more than one owner!' % self.project_id)
 
-            self.project_owner = project_rels[0].partner_id
+            self.project_owner = odooclient.project_relationships.get(
+                project_rels[0])[0].partner_id
 
         self.add_note("Found owner: %s" % self.project_owner.name)
         return self.project_owner
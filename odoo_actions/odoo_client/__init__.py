@@ -1,20 +1,236 @@
+import os
+import threading
+import weakref
+from contextlib import contextmanager
+
 from django.conf import settings
+from django.core.signals import request_finished
 
+from odoo_actions.odoo_client import country_index
+from odoo_actions.odoo_client import partner_index
+from odoo_actions.odoo_client import partner_sync
+from odoo_actions.odoo_client import singleflight
 from odoo_actions.odoo_client.client import OdooClient
+from odoo_actions.odoo_client.pool import (
+    ClientPool, HealthChecker, DEFAULT_POOL_SIZE, DEFAULT_POOL_TIMEOUT,
+    DEFAULT_HEALTH_CHECK_INTERVAL)
 
 DEFAULT_PHYSICAL_ADDRESS_CONTACT_NAME = "Physical Address"
 
 
-cached_client = None
+client_pool = None
+health_checker = None
+country_refresher = None
+partner_syncer = None
+_pool_lock = threading.Lock()
+_pool_pid = os.getpid()
+_local = threading.local()
+
+
+def _get_client_conf():
+    # get odoo auth setting from settings
+    return settings.PLUGIN_SETTINGS.get(
+        "adjutant-odoo", {}).get('odoo_client', {})
+
+
+def _reset_after_fork():
+    """Forget every client inherited from a parent process.
+
+    A forked child shares its parent's sockets, so reusing the parent's
+    clients would interleave both processes' traffic on one connection.
+    We drop our references without logging out (which would end the
+    parent's session too) and let the child build its own pool.
+    """
+    global client_pool
+    global health_checker
+    global country_refresher
+    global partner_syncer
+    global _pool_lock
+    global _pool_pid
+    global _local
+    client_pool = None
+    # Threads don't survive a fork, so the child needs its own checker.
+    health_checker = None
+    country_refresher = None
+    partner_syncer = None
+    _pool_lock = threading.Lock()
+    _pool_pid = os.getpid()
+    _local = threading.local()
+    # Calls the parent's threads had in flight will never finish here.
+    singleflight.reads.reset()
+    country_index.countries.reset()
+    partner_index.partners.reset()
+    partner_sync.partners.reset()
+
+
+def _check_pid():
+    if _pool_pid != os.getpid():
+        _reset_after_fork()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def get_client_pool():
+    global client_pool
+    global health_checker
+    global country_refresher
+    global partner_syncer
+    _check_pid()
+    if client_pool is None:
+        with _pool_lock:
+            if client_pool is None:
+                conf = _get_client_conf()
+                pool = ClientPool(
+                    lambda: OdooClient(conf),
+                    size=int(conf.get('pool_size', DEFAULT_POOL_SIZE)),
+                    timeout=float(
+                        conf.get('pool_timeout', DEFAULT_POOL_TIMEOUT)))
+
+                # A falsy interval turns the background checks off.
+                interval = conf.get(
+                    'health_check_interval', DEFAULT_HEALTH_CHECK_INTERVAL)
+                if interval:
+                    health_checker = HealthChecker(pool, float(interval))
+                    health_checker.start()
+
+                interval = conf.get(
+                    'country_refresh_interval',
+                    country_index.DEFAULT_REFRESH_INTERVAL)
+                if interval:
+                    country_refresher = country_index.CountryIndexRefresher(
+                        pool, float(interval))
+                    country_refresher.start()
+
+                partner_sync.partners.deletion_check_interval = float(
+                    conf.get('partner_deletion_check_interval',
+                             partner_sync.DEFAULT_DELETION_CHECK_INTERVAL))
+                partner_sync.partners.pull_max_age = float(
+                    conf.get('partner_pull_max_age',
+                             partner_sync.DEFAULT_PULL_MAX_AGE))
+                partner_sync.partners.overlap = float(
+                    conf.get('partner_sync_overlap',
+                             partner_sync.DEFAULT_SYNC_OVERLAP))
+                # The partner index is only loaded (by the syncer) if
+                # asked for, as it holds every partner in each process.
+                interval = conf.get(
+                    'partner_sync_interval',
+                    partner_sync.DEFAULT_SYNC_INTERVAL)
+                if conf.get('partner_index') and interval:
+                    partner_syncer = partner_sync.PartnerSyncer(
+                        pool, float(interval))
+                    partner_syncer.start()
+                client_pool = pool
+    return client_pool
+
+
+class _Lease(object):
+    """A thread's hold on a pooled client, kept in the thread's locals.
+
+    If the thread ends without releasing it, the lease is garbage
+    collected with the thread's locals, and the client goes back to
+    the pool rather than being lost.
+    """
+
+    def __init__(self, pool, client):
+        self.client = client
+        # Shared with the callback, which can't reach the dead lease.
+        self._state = {'pool': pool, 'client': client}
+        _reclaimers.add(weakref.ref(self, self._reclaimer(self._state)))
+
+    @staticmethod
+    def _reclaimer(state):
+        def reclaim(ref):
+            _reclaimers.discard(ref)
+            client = state.pop('client', None)
+            # Not if we've forked since, as the pool is the parent's.
+            if client is not None and state['pool'] is client_pool:
+                state['pool'].checkin(client)
+        return reclaim
+
+    def release(self):
+        client = self._state.pop('client', None)
+        if client is not None:
+            self._state['pool'].checkin(client)
+
+
+# Weak references to every lease, which must outlive them for their
+# callbacks to run.
+_reclaimers = set()
 
 
 def get_odoo_client():
-    global cached_client
-    if not cached_client:
-        # get odoo auth setting from settings
-        conf = settings.PLUGIN_SETTINGS.get(
-            "adjutant-odoo", {}).get('odoo_client', {})
-        # setup client
-        cached_client = OdooClient(conf)
-
-    return cached_client
+    """Get the Odoo client leased to the current thread.
+
+    The first call in a thread checks a client out of the pool, and
+    later calls in that thread get the same client back until
+    release_odoo_client is called. This happens automatically at the
+    end of each request; code running outside a request should use
+    odoo_client_lease instead. A thread which ends still holding a
+    client gives it back to the pool once its locals are collected.
+
+    Raises PoolTimeout if every client is in use for longer than
+    the configured 'pool_timeout'.
+    """
+    _check_pid()
+    lease = getattr(_local, 'lease', None)
+    if lease is None:
+        pool = get_client_pool()
+        lease = _Lease(pool, pool.checkout())
+        _local.lease = lease
+    return lease.client
+
+
+def release_odoo_client(*args, **kwargs):
+    """Return the current thread's client (if any) to the pool."""
+    _check_pid()
+    lease = getattr(_local, 'lease', None)
+    if lease is not None:
+        _local.lease = None
+        lease.release()
+
+
+@contextmanager
+def odoo_client_lease():
+    """Lease a client to this thread for the duration of a 'with' block.
+
+    For code outside a request, such as management commands or task
+    processing threads, where nothing else releases the client:
+
+        with odoo_client_lease() as odooclient:
+            ...
+
+    get_odoo_client returns the same client within the block. If the
+    thread already holds a client, that is used and kept afterwards.
+    """
+    held = getattr(_local, 'lease', None) is not None
+    client = get_odoo_client()
+    try:
+        yield client
+    finally:
+        if not held:
+            release_odoo_client()
+
+
+def warm_odoo_client():
+    """Log in one pooled client now rather than on the first request."""
+    with get_client_pool().client() as client:
+        client.connect()
+
+
+def post_fork(*args, **kwargs):
+    """Hook for pre-forking servers to call in each new worker.
+
+    Drops any clients inherited from the parent and, if 'warm_after_fork'
+    is set, logs in a fresh client straight away so the worker's first
+    request doesn't pay for it. Accepts and ignores any arguments, so it
+    can be used directly as e.g. gunicorn's post_fork server hook.
+    """
+    _reset_after_fork()
+    if _get_client_conf().get('warm_after_fork'):
+        warm_odoo_client()
+
+
+request_finished.connect(
+    release_odoo_client, dispatch_uid='odoo_client_release')
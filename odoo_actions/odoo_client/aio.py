@@ -0,0 +1,187 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""asyncio counterpart to OdooClient.
+
+Talks JSON-RPC to Odoo's /jsonrpc endpoint over aiohttp, so independent
+lookups can be awaited concurrently:
+
+    async with AsyncOdooClient(conf) as odooclient:
+        project, countries = await asyncio.gather(
+            odooclient.projects.list([('tenant_id', '=', project_id)]),
+            odooclient.countries.list([]))
+
+Requires Python 3 and the 'async' extra (aiohttp).
+"""
+
+import asyncio
+import itertools
+from collections.abc import Iterable
+
+import aiohttp
+from odoorpc.error import RPCError
+
+from .projects import CloudProjectManager
+from .credits import CloudCreditManager
+from .partners import PartnerManager
+from .project_relationships import ProjectRelationshipManager
+from .countries import CountryManager
+
+
+def _as_list(ids):
+    if isinstance(ids, str) or not isinstance(ids, Iterable):
+        ids = [ids, ]
+    return list(ids)
+
+
+class AsyncBaseManager(object):
+    """asyncio counterpart to BaseManager.
+
+    There are no browse records without a blocking connection behind
+    them, so resources always come back as dicts, as with read=True.
+    """
+
+    def __init__(self, odooclient, manager_class):
+        self.client = odooclient
+        self.model = manager_class.model
+        self.fields = manager_class.fields
+
+    def _call(self, method, *args, **kwargs):
+        return self.client.execute_kw(self.model, method, args, kwargs)
+
+    async def get(self, ids):
+        """Get one or more Resources by id.
+
+        Always returns a list even when 1 id is given.
+        """
+        kwargs = {}
+        if self.fields:
+            kwargs['fields'] = self.fields
+        return await self._call('read', _as_list(ids), **kwargs)
+
+    async def list(self, filters, get=True):
+        """Get a list of Resources.
+
+        'filters' is a list of search options.
+            [('field', '=', value), ]
+        """
+        ids = await self._call('search', filters)
+        if get:
+            return await self.get(ids)
+        return ids
+
+    async def create(self, **fields):
+        """Create a Resource, returning its id."""
+        return await self._call('create', fields)
+
+    async def load(self, fields, rows):
+        """Loads in a Resource.
+
+        'fields' is a list of fields to import. - list(str)
+        'rows' is the item data. - list(list(str))
+        """
+        return await self._call('load', fields, rows)
+
+    async def delete(self, ids):
+        """Delete 1 or more Resources by id."""
+        return await self._call('unlink', _as_list(ids))
+
+
+class AsyncOdooClient(object):
+    """asyncio counterpart to OdooClient.
+
+    Takes the same config, and like OdooClient only logs in on first
+    RPC. Each call carries the uid and password, so concurrent calls
+    don't contend over a session.
+    """
+
+    def __init__(self, config, session=None):
+        odoo_conf = config.get('odoorpc', {})
+        scheme = 'https' if odoo_conf.get('protocol') == 'jsonrpc+ssl' \
+            else 'http'
+        self._url = '%s://%s:%s/jsonrpc' % (
+            scheme, odoo_conf.get('hostname'), int(odoo_conf.get('port')))
+        self._database = odoo_conf.get('database')
+        self._user = odoo_conf.get('user')
+        self._password = odoo_conf.get('password')
+        self._timeout = aiohttp.ClientTimeout(
+            total=float(odoo_conf.get('timeout', 120)))
+
+        self._session = session
+        self._owns_session = session is None
+        self._uid = None
+        self._login_lock = None
+        self._request_ids = itertools.count()
+
+        self.projects = AsyncBaseManager(self, CloudProjectManager)
+        self.credits = AsyncBaseManager(self, CloudCreditManager)
+        self.partners = AsyncBaseManager(self, PartnerManager)
+        self.project_relationships = AsyncBaseManager(
+            self, ProjectRelationshipManager)
+        self.countries = AsyncBaseManager(self, CountryManager)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def rpc(self, service, method, *args):
+        """Call 'method' of an Odoo JSON-RPC 'service'.
+
+        Raises odoorpc.error.RPCError if Odoo returns an error, as the
+        synchronous client does.
+        """
+        if self._session is None:
+            self._session = aiohttp.ClientSession(timeout=self._timeout)
+        payload = {
+            'jsonrpc': '2.0',
+            'method': 'call',
+            'params': {'service': service, 'method': method, 'args': args},
+            'id': next(self._request_ids),
+        }
+        async with self._session.post(self._url, json=payload) as response:
+            response.raise_for_status()
+            data = await response.json()
+        error = data.get('error')
+        if error:
+            # Errors raised before Odoo's dispatch have no 'data'.
+            raise RPCError(
+                error.get('data', {}).get('message') or
+                error.get('message'), error)
+        return data['result']
+
+    async def login(self):
+        uid = await self.rpc(
+            'common', 'login', self._database, self._user, self._password)
+        if not uid:
+            raise RPCError("Wrong login ID or password")
+        self._uid = uid
+
+    async def execute_kw(self, model, method, args=None, kwargs=None):
+        if self._uid is None:
+            # The lock must be made on the loop that uses it.
+            if self._login_lock is None:
+                self._login_lock = asyncio.Lock()
+            async with self._login_lock:
+                if self._uid is None:
+                    await self.login()
+        return await self.rpc(
+            'object', 'execute_kw', self._database, self._uid,
+            self._password, model, method, list(args or []), kwargs or {})
@@ -0,0 +1,119 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Browse records which only prefetch some of their fields.
+
+odoorpc's browse reads every non-relational column up front, which for
+wide models like res.partner is most of the row. browse_fields reads
+just the fields asked for. The first time any other field is used, it
+and every non-relational field not read yet are read for the whole
+recordset, in one call, so a record used for more than its projection
+costs one more call rather than one per field.
+
+This works with odoorpc's internals: its field descriptors look values
+up in the record's '_values' dicts, which here fetch what is missing.
+"""
+
+from odoorpc.models import _normalize_ids
+
+
+class MissingFields(object):
+    """Reads the fields of a browse recordset which haven't been read."""
+
+    def __init__(self, model, ids, values, context, fields):
+        self._model = model
+        self._ids = ids
+        self._values = values
+        self._context = context
+        self._read = set(fields)
+
+    def fetch(self, name):
+        """Read 'name', if it hasn't been, with every other
+        non-relational field not read yet.
+
+        Relational fields are only read when used, as odoorpc does.
+        """
+        if name in self._read:
+            return
+        fields = [name] + sorted(
+            other for other, field in self._model._columns.items()
+            if other != name and other not in self._read and
+            not getattr(field, 'relation', False))
+        self._read.update(fields)
+        rows = self._model.read(
+            list(self._ids), fields, context=self._context,
+            load='_classic_write')
+        for row in rows:
+            for field in fields:
+                self._values[field].setdefault(row['id'], row[field])
+
+
+class LazyFieldValues(dict):
+    """A browse record's values for one field, by id.
+
+    Looking up an id we have no value for reads the field (along with
+    the others missing) for every record in the recordset.
+    """
+
+    def __init__(self, missing, ids, name):
+        super(LazyFieldValues, self).__init__()
+        self._missing = missing
+        self._ids = ids
+        self._name = name
+
+    def get(self, res_id, default=None):
+        if res_id not in self and res_id in self._ids:
+            self._missing.fetch(self._name)
+        return super(LazyFieldValues, self).get(res_id, default)
+
+    def __missing__(self, res_id):
+        if res_id in self._ids:
+            self._missing.fetch(self._name)
+            if res_id in self:
+                return super(LazyFieldValues, self).__getitem__(res_id)
+        raise KeyError(res_id)
+
+
+def browse_fields(model, ids, fields):
+    """Browse 'ids' of the odoorpc 'model', reading only 'fields' now.
+
+    Returns a recordset as model.browse does.
+    """
+    records = model()
+    records._env_local = model.env
+    records._ids = _normalize_ids(ids)
+    records._from_record = None
+    records._values = {}
+    records._values_to_write = {}
+    context = model.env.context
+    fields = [name for name in fields
+              if name != 'id' and name in model._columns]
+    missing = MissingFields(
+        model, records._ids, records._values, context, fields)
+    for name in model._columns:
+        records._values[name] = LazyFieldValues(missing, records._ids, name)
+        records._values_to_write[name] = {}
+
+    if records._ids:
+        rows = model.read(
+            records._ids, fields, context=context, load='_classic_write')
+        not_found = set(records._ids) - set(row['id'] for row in rows)
+        if not_found:
+            raise ValueError(
+                "There is no '%s' record with IDs %s."
+                % (model._name, sorted(not_found)))
+        for row in rows:
+            for name in fields:
+                records._values[name][row['id']] = row[name]
+    return records
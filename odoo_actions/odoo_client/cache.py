@@ -0,0 +1,154 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Read-through caches for BaseManager.get(read=True).
+
+Caching is opt-in per manager, with the 'read_cache' block of the
+odoo_client settings:
+
+    read_cache:
+        countries:
+            ttl: 3600
+        partners:
+            backend: django
+            ttl: 60
+
+Entries are stored per record, as {fieldset: row}, so a create, write or
+delete through the manager can drop every cached read of a record at
+once. The 'local' backend is an LRU cache in this process; the 'django'
+backend uses one of Django's caches, to share entries between workers.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+DEFAULT_TTL = 300
+DEFAULT_MAX_SIZE = 1000
+
+
+class LocalCache(object):
+    """In-process LRU cache whose entries expire after 'ttl' seconds."""
+
+    def __init__(self, ttl=DEFAULT_TTL, max_size=DEFAULT_MAX_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys):
+        now = time.time()
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is None or entry[0] <= now:
+                    continue
+                # Put it back at the most recently used end.
+                self._entries[key] = entry
+                found[key] = entry[1]
+        return found
+
+    def set_many(self, mapping):
+        expires = time.time() + self.ttl
+        with self._lock:
+            for key, value in mapping.items():
+                self._entries.pop(key, None)
+                self._entries[key] = (expires, value)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete_many(self, keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class DjangoCache(object):
+    """Store entries in one of Django's configured caches."""
+
+    def __init__(self, ttl=DEFAULT_TTL, alias='default',
+                 key_prefix='adjutant-odoo'):
+        self.ttl = ttl
+        self.alias = alias
+        self.key_prefix = key_prefix
+
+    @property
+    def _cache(self):
+        from django.core.cache import caches
+        return caches[self.alias]
+
+    def _key(self, key):
+        return "%s:%s:%s" % ((self.key_prefix, ) + tuple(key))
+
+    def get_many(self, keys):
+        keys = dict((self._key(key), key) for key in keys)
+        found = self._cache.get_many(list(keys))
+        return dict((keys[key], value) for key, value in found.items())
+
+    def set_many(self, mapping):
+        self._cache.set_many(
+            dict((self._key(key), value) for key, value in mapping.items()),
+            timeout=self.ttl)
+
+    def delete_many(self, keys):
+        self._cache.delete_many([self._key(key) for key in keys])
+
+    def clear(self):
+        # Other things may share the Django cache, so leave it be and
+        # let our entries expire.
+        pass
+
+
+def build_local_cache(cache_conf):
+    return LocalCache(
+        ttl=float(cache_conf.get('ttl', DEFAULT_TTL)),
+        max_size=int(cache_conf.get('max_size', DEFAULT_MAX_SIZE)))
+
+
+def build_django_cache(cache_conf):
+    return DjangoCache(
+        ttl=float(cache_conf.get('ttl', DEFAULT_TTL)),
+        alias=cache_conf.get('cache_alias', 'default'))
+
+
+BACKENDS = {
+    'local': build_local_cache,
+    'django': build_django_cache,
+}
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_read_cache(name, cache_conf):
+    """Get the cache for the manager 'name', building it if needed.
+
+    Every client in the process shares the one cache per manager, so a
+    write through any of them invalidates it for all.
+    """
+    with _caches_lock:
+        if name not in _caches:
+            backend = cache_conf.get('backend') or 'local'
+            if backend not in BACKENDS:
+                raise ValueError(
+                    "Unknown read_cache backend '%s', expected one of: %s"
+                    % (backend, ", ".join(sorted(BACKENDS))))
+            _caches[name] = BACKENDS[backend](cache_conf)
+        return _caches[name]
@@ -1,10 +1,135 @@
+import errno
+import logging
+import socket
+import threading
+from contextlib import contextmanager
+
 import odoorpc
 
+try:
+    from urllib.error import URLError
+except ImportError:
+    from urllib2 import URLError
+
 from .projects import CloudProjectManager
 from .credits import CloudCreditManager
 from .partners import PartnerManager
 from .project_relationships import ProjectRelationshipManager
 from .countries import CountryManager
+from .cache import get_read_cache
+from .common import BaseManager
+from .schema import get_schema_store
+from .transaction import Transaction
+from .transport import get_opener
+
+
+LOG = logging.getLogger(__name__)
+
+SESSION_EXPIRED_ERRORS = (
+    'odoo.http.SessionExpiredException',
+    'openerp.http.SessionExpiredException',
+)
+
+# Connection errors which mean the request never reached Odoo.
+UNSENT_ERRNOS = (errno.ECONNREFUSED, errno.EHOSTUNREACH, errno.ENETUNREACH)
+
+
+def is_unsent_error(error):
+    """Did 'error' stop the request before Odoo could have seen it?
+
+    Anything else, like a timeout or a connection reset mid call, may
+    come after Odoo has done the work, so sending it again could e.g.
+    create a record twice. (Kept-alive connections which died while
+    idle are replaced by the transport before anything is sent.)
+    """
+    if isinstance(error, URLError):
+        error = error.reason
+    if isinstance(error, socket.timeout):
+        return False
+    if isinstance(error, socket.gaierror):
+        return True
+    return (isinstance(error, socket.error) and
+            error.errno in UNSENT_ERRNOS)
+
+
+def is_recoverable_error(error):
+    """Would logging back in and retrying fix this error?
+
+    True for an expired session, which Odoo rejects before running the
+    call, or for a connection which couldn't be made (e.g. because the
+    Odoo server was restarting).
+    """
+    if isinstance(error, odoorpc.error.RPCError):
+        info = error.info or {}
+        data = info.get('data') or {}
+        return (info.get('code') == 100 or
+                data.get('name') in SESSION_EXPIRED_ERRORS)
+    return is_unsent_error(error)
+
+
+class ReconnectingODOO(odoorpc.ODOO):
+    """odoorpc.ODOO which recovers from expired sessions.
+
+    When a call fails because the session expired or the connection
+    couldn't be made, we log in again and retry the call once. Calls
+    which time out or fail part way are never retried, as Odoo may
+    have run them.
+    """
+
+    _relogging_in = False
+
+    def json(self, url, params):
+        try:
+            return super(ReconnectingODOO, self).json(url, params)
+        except Exception as e:
+            if (self._relogging_in or not self._login or
+                    not is_recoverable_error(e)):
+                raise
+            LOG.warning("Odoo call to '%s' failed (%s), logging back in "
+                        "and retrying." % (url, e))
+
+        self._relogin()
+        return super(ReconnectingODOO, self).json(url, params)
+
+    def _relogin(self):
+        self._relogging_in = True
+        try:
+            self.login(self._env.db, self._login, self._password)
+        finally:
+            self._relogging_in = False
+
+
+def _model_class(env, model, fields_get):
+    """Build the odoorpc proxy class for 'model' from its fields_get,
+    as odoorpc's Environment does after fetching it."""
+    attrs = {
+        '_env': env,
+        '_odoo': env._odoo,
+        '_name': model,
+        '_columns': {},
+    }
+    for name, data in fields_get.items():
+        if name not in odoorpc.env.FIELDS_RESERVED:
+            field = odoorpc.fields.generate_field(name, data)
+            attrs['_columns'][name] = field
+            attrs[name] = field
+    return type(str(model.replace('.', '_')), (odoorpc.models.Model, ), attrs)
+
+
+class LazyModel(object):
+    """Resolve an odoorpc model proxy on first access.
+
+    Looking up a model in the odoorpc env costs a fields_get round
+    trip, so we only pay that for models something actually uses.
+    """
+
+    def __init__(self, model):
+        self.model = model
+
+    def __get__(self, client, owner):
+        if client is None:
+            return self
+        return client.get_model(self.model)
 
 
 class OdooClient(object):
@@ -14,33 +139,172 @@ class OdooClient(object):
     OdooRPC to let us pretend this works like an
     OpenStack client, and to hide away some of the
     odd ways OdooRPC works.
+
+    Nothing is sent to Odoo until the first RPC: the login happens
+    then, and each model is looked up when first used. Calls that fail
+    because of an expired session or a stale connection are retried
+    once after logging back in.
     """
 
+    # TODO(adriant): Rename tenant to project once renamed in odoo:
+    _Project = LazyModel('cloud.tenant')
+    _Partner = LazyModel('res.partner')
+    _Credit = LazyModel('cloud.credit')
+    _PartnerRelationship = LazyModel('cloud.tenant_partner')
+    _Country = LazyModel('res.country')
+
+    _MailMessage = LazyModel('mail.message')
+
+    # Cleared if the server turns out not to have search_read.
+    supports_search_read = True
+
     def __init__(self, config):
-        odoo_conf = config.get('odoorpc', {})
-        self._odoorpc = odoorpc.ODOO(
+        self._odoo_conf = config.get('odoorpc', {})
+        self._connection = None
+        self._models = {}
+        self._local = threading.local()
+        self._schema_store = get_schema_store(config)
+        # Extra names to match countries by, as {alpha-2 code: [names]}.
+        self.country_aliases = config.get('country_aliases') or {}
+
+        # Now setup the managers:
+        self.projects = CloudProjectManager(self)
+        self.credits = CloudCreditManager(self)
+        self.partners = PartnerManager(self)
+        self.project_relationships = ProjectRelationshipManager(self)
+        self.countries = CountryManager(self)
+
+        for name, cache_conf in (config.get('read_cache') or {}).items():
+            manager = getattr(self, name, None)
+            if not isinstance(manager, BaseManager):
+                raise ValueError(
+                    "Unknown manager '%s' in read_cache settings." % name)
+            manager.cache = get_read_cache(name, cache_conf or {})
+
+    @property
+    def _odoorpc(self):
+        """The logged in odoorpc connection, created on first use."""
+        if self._connection is None:
+            self._connection = self._connect()
+        return self._connection
+
+    def connect(self):
+        """Log in now rather than waiting for the first RPC."""
+        self._odoorpc
+
+    def _connect(self):
+        odoo_conf = self._odoo_conf
+        kwargs = {}
+        opener = get_opener(odoo_conf)
+        if opener is not None:
+            kwargs['opener'] = opener
+        connection = ReconnectingODOO(
             odoo_conf.get('hostname'),
             protocol=odoo_conf.get('protocol'),
             port=int(odoo_conf.get('port')),
-            version=odoo_conf.get('version'))
+            version=odoo_conf.get('version'),
+            **kwargs)
 
-        self._odoorpc.login(
+        connection.login(
             odoo_conf.get('database'),
             odoo_conf.get('user'),
             odoo_conf.get('password'))
+        return connection
 
-        # TODO(adriant): Rename tenant to project once renamed in odoo:
-        self._Project = self._odoorpc.env['cloud.tenant']
-        self._Partner = self._odoorpc.env['res.partner']
-        self._Credit = self._odoorpc.env['cloud.credit']
-        self._PartnerRelationship = self._odoorpc.env['cloud.tenant_partner']
-        self._Country = self._odoorpc.env['res.country']
+    @property
+    def supports_create_multi(self):
+        """Can create() make several records in one call (Odoo 12+)."""
+        return odoorpc.tools.v(self._odoorpc.version)[0] >= 12
 
-        self._MailMessage = self._odoorpc.env['mail.message']
+    @property
+    def current_transaction(self):
+        """The Transaction open in this thread, or None."""
+        return getattr(self._local, 'transaction', None)
 
-        # Now setup the managers:
-        self.projects = CloudProjectManager(self)
-        self.credits = CloudCreditManager(self)
-        self.partners = PartnerManager(self)
-        self.project_relationships = ProjectRelationshipManager(self)
-        self.countries = CountryManager(self)
+    @contextmanager
+    def transaction(self):
+        """Collect the writes made in this block and send them on exit.
+
+            with odooclient.transaction():
+                odooclient.partners.write(partner_id, {'name': name})
+                ...
+
+        Writes are batched into as few calls as possible. If the block
+        raises, nothing is sent. Reads inside the block still see the
+        values from before it.
+
+        Transactions are per thread, so other threads using this client
+        keep writing straight through. Nested blocks join the outermost
+        one, which does the sending.
+        """
+        if self.current_transaction is not None:
+            yield self.current_transaction
+            return
+
+        transaction = Transaction(self)
+        self._local.transaction = transaction
+        try:
+            yield transaction
+        except BaseException:
+            transaction.rollback()
+            raise
+        finally:
+            self._local.transaction = None
+        transaction.commit()
+
+    def get_manager(self, model):
+        """Get the manager for 'model', or a plain one if we have none."""
+        for manager in (self.projects, self.credits, self.partners,
+                        self.project_relationships, self.countries):
+            if manager.model == model:
+                return manager
+        manager = BaseManager(self)
+        manager.model = model
+        return manager
+
+    def get_schema(self, model):
+        """The fields_get schema of 'model', fetched only if we don't
+        have a current copy in memory or on disk."""
+        odoo_conf = self._odoo_conf
+        key = (odoo_conf.get('hostname'), odoo_conf.get('port'),
+               odoo_conf.get('database'), model)
+        return self._schema_store.get(
+            key, model, self._odoorpc.version,
+            lambda: self._odoorpc.execute(model, 'fields_get'))
+
+    def get_model(self, model):
+        """Get the odoorpc proxy for 'model', looking it up if needed."""
+        try:
+            return self._models[model]
+        except KeyError:
+            env = self._odoorpc.env
+            if model not in env.registry:
+                # Saves odoorpc fetching the fields_get we have cached.
+                env.registry[model] = _model_class(
+                    env, model, self.get_schema(model).fields)
+            self._models[model] = env[model]
+            return self._models[model]
+
+    def ping(self):
+        """Check the session with a cheap authenticated round trip.
+
+        A dead session is recovered like any other call. If even that
+        fails, the connection is dropped so the next use starts afresh.
+        Clients which have not connected yet are left alone.
+
+        Returns: True if the client is usable.
+        """
+        if self._connection is None:
+            return True
+        try:
+            self._connection.execute('res.users', 'context_get')
+            return True
+        except Exception as e:
+            LOG.warning("Odoo liveness check failed: %s" % e)
+            self.reset()
+            return False
+
+    def reset(self):
+        """Drop the connection and models, to be rebuilt on next use."""
+        self._connection = None
+        self._models = {}
@@ -1,21 +1,331 @@
-from collections import Iterable
+import itertools
+import logging
+import threading
+from collections import Iterable, OrderedDict
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from odoorpc.error import RPCError
+from odoorpc.fields import Many2one
+from odoorpc.models import Model
+
+from . import identity_map
+from .browse import browse_fields
+from . import singleflight
+from .pool import PoolTimeout
+from .records import record_type
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 500
+
+
+class BulkCreateError(Exception):
+    """Some of the records in a create_many call could not be created.
+
+    'ids' has an entry per record given, in order: its id, or None if
+    it failed. 'errors' maps the index of each failed record to its error.
+    """
+
+    def __init__(self, ids, errors):
+        super(BulkCreateError, self).__init__(
+            "Failed to create %s of %s records: %s" % (
+                len(errors), len(ids),
+                "; ".join("%s: %s" % (index, errors[index])
+                          for index in sorted(errors))))
+        self.ids = ids
+        self.errors = errors
+
+
+class LoadResult(object):
+    """The combined outcome of a BaseManager.load_stream call.
+
+    Rows are split into chunks, each loaded (and committed by Odoo) in
+    its own call. 'committed' holds the indexes of the chunks which
+    went in, and 'failed' maps the index of each chunk which didn't to
+    its error messages. Pass 'committed' back in as 'skip_chunks' to
+    resume a failed load without duplicating rows.
+    """
+
+    def __init__(self):
+        self.committed = set()
+        self.failed = {}
+        self._ids = {}
+        self._messages = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ids(self):
+        """Ids of the loaded records, in row order."""
+        return [res_id for index in sorted(self._ids)
+                for res_id in self._ids[index]]
+
+    @property
+    def messages(self):
+        """Messages from every chunk, in row order."""
+        return [message for index in sorted(self._messages)
+                for message in self._messages[index]]
+
+    def add(self, index, first_row, response):
+        # Odoo numbers rows from the start of the call, so renumber them
+        # from the start of the whole load.
+        messages = []
+        for message in response.get('messages') or []:
+            message = dict(message, chunk=index)
+            if message.get('rows'):
+                message['rows'] = {
+                    'from': message['rows']['from'] + first_row,
+                    'to': message['rows']['to'] + first_row,
+                }
+            messages.append(message)
+
+        with self._lock:
+            self._messages[index] = messages
+            # Odoo returns ids as False when it rolls the chunk back.
+            if response.get('ids'):
+                self._ids[index] = response['ids']
+                self.committed.add(index)
+            else:
+                self.failed[index] = messages
+
+    def add_error(self, index, error):
+        with self._lock:
+            self.failed[index] = [{
+                'type': 'error', 'message': str(error), 'chunk': index}]
+
+
+def _freeze(value):
+    """Turn lists into tuples, as Odoo treats them the same in domains
+    and arguments."""
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _is_missing_method(error, method):
+    """Whether the RPCError 'error' is Odoo saying the model has no
+    'method', rather than the call failing.
+
+    Odoo reports that as an AttributeError, and JSON-RPC as its 'Method
+    not found' code.
+    """
+    info = error.info if isinstance(error.info, dict) else {}
+    if info.get('code') == -32601:
+        return True
+    data = info.get('data') or {}
+    return (data.get('name', '').endswith('.AttributeError') and
+            method in (data.get('message') or ''))
+
+
+def _copy_rows(result):
+    if isinstance(result, list):
+        return [dict(item) if isinstance(item, dict) else item
+                for item in result]
+    return result
+
+
+def _comparable(value):
+    """Reduce a field value to something we can compare with '!='.
+
+    Many2one fields come back as a browse record or an (id, name) pair
+    but are written as an id, and Odoo returns False for empty fields.
+    """
+    if isinstance(value, Model):
+        return value.id or False
+    if isinstance(value, (list, tuple)):
+        return value[0] if value else False
+    if value is None or value == '':
+        return False
+    return value
+
+
+def _is_changed(record, name, value):
+    # x2many values are lists of commands, so can't be compared.
+    if isinstance(value, (list, tuple)):
+        return True
+    if isinstance(record, dict):
+        current = record.get(name)
+    else:
+        current = getattr(record, name)
+    return _comparable(current) != _comparable(value)
 
 
 class BaseManager(object):
 
-    # you must initialise self.resource_env in __init__
+    # you must set the odoo model name this manager wraps
+    model = None
 
     fields = None
 
+    # Read-through cache for get(read=True), set up by the client if
+    # enabled for this manager in the 'read_cache' settings.
+    cache = None
+
     class Meta:
         abstract = True
 
+    def __init__(self, odooclient):
+        self.client = odooclient
+
+    @property
+    def resource_env(self):
+        """The odoorpc proxy for this manager's model.
+
+        Resolved through the client on first use, so managers which
+        are never used cost nothing.
+        """
+        return self.client.get_model(self.model)
+
+    @property
+    def schema(self):
+        """The cached fields_get schema of this manager's model."""
+        return self.client.get_schema(self.model)
+
+    def invalidate(self, ids=None):
+        """Forget any loaded or cached copies of 'ids'.
+
+        With no 'ids', forgets every record of the model this request
+        has loaded. The read cache can't be cleared by model, so only
+        given ids are dropped from it.
+        """
+        singleflight.reads.invalidate(self.model)
+        id_map = identity_map.current()
+        if id_map is not None:
+            id_map.invalidate(self.model, ids)
+        if self.cache is not None and ids:
+            self.cache.delete_many([(self.model, res_id) for res_id in ids])
+
+    def _call_shared(self, method, *args, **kwargs):
+        """Call a read-only 'method' of the model.
+
+        Threads making the same call at the same time share the one
+        RPC. Those which waited on another get their own copy of its
+        result.
+        """
+        key = (method, repr(_freeze(args)), repr(sorted(
+            (name, _freeze(value)) for name, value in kwargs.items())))
+        return singleflight.reads.do(
+            self.model, key,
+            lambda: getattr(self.resource_env, method)(*args, **kwargs),
+            copy=_copy_rows)
+
+    def record_type(self, fields=None):
+        """The compact record type for 'fields' (or the manager's).
+
+        'id' is always included.
+        """
+        fields = list(fields or self.fields or ())
+        if not fields:
+            raise ValueError(
+                "Compact records of %s need a list of fields." % self.model)
+        if 'id' not in fields:
+            fields.insert(0, 'id')
+        name = type(self).__name__.replace('Manager', '') + 'Record'
+        return record_type(name, fields)
+
+    def _finish_rows(self, rows, fields, compact, include):
+        if include:
+            return self._include(rows, include)
+        if compact:
+            return self._to_records(rows, fields)
+        return rows
+
+    def _include(self, rows, include):
+        """Copies of 'rows' with the related records of the 'include'
+        paths in place of their many2one values."""
+        # Group the paths by their first field:
+        #   {'partner_id': ['country_id']}
+        nested = OrderedDict()
+        for path in include:
+            name, _, rest = path.partition('.')
+            nested.setdefault(name, [])
+            if rest:
+                nested[name].append(rest)
+
+        # Copied, as the rows may be shared with the identity map.
+        rows = [dict(row) for row in rows]
+        columns = self.resource_env._columns
+        for name, sub_include in nested.items():
+            field = columns.get(name)
+            if not isinstance(field, Many2one):
+                raise ValueError(
+                    "Can only include many2one fields, and '%s' of %s "
+                    "isn't one." % (name, self.model))
+
+            ids = []
+            for row in rows:
+                if row.get(name) and row[name][0] not in ids:
+                    ids.append(row[name][0])
+            related = {}
+            if ids:
+                manager = self.client.get_manager(field.relation)
+                for related_row in manager.get(
+                        ids, read=True, include=sub_include or None):
+                    related[related_row['id']] = related_row
+
+            for row in rows:
+                if row.get(name):
+                    row[name] = related.get(row[name][0], False)
+        return rows
+
+    def _to_records(self, rows, fields):
+        record_cls = self.record_type(fields)
+        columns = getattr(self.resource_env, '_columns', None) or {}
+        many2one = set(
+            name for name in record_cls._fields
+            if isinstance(columns.get(name), Many2one))
+        return [record_cls.from_row(row, many2one) for row in rows]
+
+    def _read(self, ids, fields):
+        """Read 'ids' through the read cache, if there is one."""
+        if self.cache is None:
+            return self._call_shared('read', ids, fields=fields)
+
+        fieldset = ",".join(sorted(fields)) if fields else "*"
+        keys = [(self.model, res_id) for res_id in ids]
+        generation = singleflight.reads.generation(self.model)
+        cached = self.cache.get_many(keys)
+
+        rows = {}
+        missing = []
+        for key in keys:
+            row = cached.get(key, {}).get(fieldset)
+            if row is None:
+                missing.append(key[1])
+            else:
+                rows[key[1]] = row
+
+        if missing:
+            updates = {}
+            for row in self._call_shared('read', missing, fields=fields):
+                rows[row['id']] = row
+                key = (self.model, row['id'])
+                updates[key] = dict(cached.get(key, {}), **{fieldset: row})
+            # Unless a write or delete came in during the read, which
+            # may have dropped the rows we'd be putting back.
+            if singleflight.reads.generation(self.model) == generation:
+                self.cache.set_many(updates)
+
+        # Copies, so callers can't change what is cached.
+        return [dict(rows[res_id]) for res_id in ids if res_id in rows]
+
     def _is_iterable(self, ids):
         if isinstance(ids, str) or not isinstance(ids, Iterable):
             ids = [ids, ]
         return ids
 
-    def get(self, ids, read=False):
+    def _browse(self, ids, fields=None):
+        fields = fields or self.fields
+        if not fields:
+            return self.resource_env.browse(ids)
+        return browse_fields(self.resource_env, ids, fields)
+
+    def get(self, ids, read=False, fields=None, compact=False,
+            include=None):
         """Get one or more Resources by id.
 
         'ids' can be 1 id, or a list of ids.
@@ -27,39 +337,376 @@ class BaseManager(object):
 
         Always returns a list even when 1 id is given.
         This is done for consistency.
+
+        'fields' overrides the manager's default fields for a read.
+        Browse records prefetch only those fields too. The first time
+        any other field is used, it's read for the whole recordset along
+        with every other non-relational field, in one call.
+        With 'compact', they are read into compact records (see
+        record_type) rather than dicts.
+
+        'include' lists many2one fields to read the related records of
+        (in one call per field) and put in place of the (id, name)
+        pairs. Dotted paths follow relations further, e.g.
+            include=['partner_id', 'partner_id.country_id']
+
+        Within an identity map scope, records already loaded in the
+        scope are returned as they are rather than fetched again, and
+        the result is always a plain list.
         """
-        if read:
-            return self.resource_env.read(
-                self._is_iterable(ids), fields=self.fields)
-        return self.resource_env.browse(self._is_iterable(ids))
+        if compact and include:
+            raise ValueError("Compact records can't include relations.")
+        ids = self._is_iterable(ids)
+        id_map = identity_map.current()
+        if read or compact or include:
+            fields = fields or self.fields
+            if id_map is None:
+                rows = self._read(ids, fields)
+            else:
+                rows = id_map.get_rows(self.model, ids, fields)
+                if rows is None:
+                    rows = id_map.add_rows(
+                        self.model, self._read(ids, fields), fields)
+            return self._finish_rows(rows, fields, compact, include)
+
+        if id_map is None:
+            return self._browse(ids, fields)
+        records = id_map.get_records(self.model, ids)
+        if records is None:
+            id_map.add_records(self.model, self._browse(ids, fields))
+            records = id_map.get_records(self.model, ids)
+        return records
 
-    def list(self, filters, get=True, read=False):
+    def list(self, filters, get=True, read=False, fields=None,
+             limit=None, offset=0, order=None, compact=False,
+             include=None):
         """Get a list of Resources.
 
         'filters' is a list of search options.`
             [('field', '=', value), ]
+
+        'limit', 'offset' and 'order' page and sort the search as
+        in Odoo. For reads, 'fields' overrides the manager's default
+        fields, and the search and read are done in one search_read
+        call where the server supports it. 'compact' and 'include' are
+        as for get.
+
+        Within an identity map scope, each distinct search is only
+        sent once.
         """
-        ids = self.resource_env.search(filters)
+        search_kwargs = {}
+        if limit:
+            search_kwargs['limit'] = limit
+        if offset:
+            search_kwargs['offset'] = offset
+        if order:
+            search_kwargs['order'] = order
+
+        id_map = identity_map.current()
+        search_key = (
+            repr(_freeze(filters)), tuple(sorted(search_kwargs.items())))
+        ids = None
+        if id_map is not None:
+            ids = id_map.get_search(self.model, search_key)
+
+        if compact and include:
+            raise ValueError("Compact records can't include relations.")
+        read = read or compact or include
+        if (ids is None and get and read and
+                self.client.supports_search_read):
+            fields = fields or self.fields
+            try:
+                rows = self._call_shared(
+                    'search_read', filters, fields=fields, **search_kwargs)
+            except RPCError as e:
+                if not _is_missing_method(e, 'search_read'):
+                    raise
+                # Don't try again, just fall back to search then read.
+                self.client.supports_search_read = False
+            else:
+                if id_map is not None:
+                    id_map.add_search(
+                        self.model, search_key, [row['id'] for row in rows])
+                    rows = id_map.add_rows(self.model, rows, fields)
+                return self._finish_rows(rows, fields, compact, include)
+
+        if ids is None:
+            ids = self._call_shared('search', filters, **search_kwargs)
+            if id_map is not None:
+                id_map.add_search(self.model, search_key, ids)
         if get:
-            return self.get(ids, read)
+            return self.get(ids, read, fields=fields, compact=compact,
+                            include=include)
+        else:
+            return list(ids)
+
+    def count(self, filters):
+        """Count the Resources matching 'filters' without reading them."""
+        return self._call_shared('search_count', filters)
+
+    def exists(self, filters):
+        """Check if any Resource matches 'filters'.
+
+        Cheaper than count, as the search stops at the first match.
+        """
+        return bool(self._call_shared('search', filters, limit=1))
+
+    def exists_ids(self, ids):
+        """Filter 'ids' down to those which exist, keeping their order.
+
+        Archived Resources still count as existing.
+        """
+        ids = list(self._is_iterable(ids))
+        if not ids:
+            return []
+        found = set(
+            self.resource_env.with_context(active_test=False).search(
+                [('id', 'in', ids)]))
+        return [res_id for res_id in ids if res_id in found]
+
+    def iter_list(self, filters, fields=None, chunk_size=DEFAULT_CHUNK_SIZE,
+                  order=None, compact=False):
+        """Iterate over matching Resources, read a chunk at a time.
+
+        Only one chunk of records is held in memory at once, so this
+        is safe to use over an entire table. Records are read as dicts,
+        or as compact records with 'compact'. The chunks are read
+        outside any identity map, so they aren't kept there either.
+
+        Ordered by id (the default), we page on the last id seen, which
+        stays cheap however far in we are and won't skip or repeat rows
+        if others are created or deleted meanwhile. Any other 'order'
+        pages by offset.
+        """
+        if order in (None, 'id', 'id asc'):
+            last_id = 0
+            while True:
+                with identity_map.suspended():
+                    records = self.list(
+                        list(filters) + [('id', '>', last_id)], read=True,
+                        fields=fields, limit=chunk_size, order='id',
+                        compact=compact)
+                for record in records:
+                    yield record
+                if len(records) < chunk_size:
+                    return
+                last_id = records[-1].id if compact else records[-1]['id']
         else:
-            return ids
+            offset = 0
+            while True:
+                with identity_map.suspended():
+                    records = self.list(
+                        filters, read=True, fields=fields, limit=chunk_size,
+                        offset=offset, order=order, compact=compact)
+                for record in records:
+                    yield record
+                if len(records) < chunk_size:
+                    return
+                offset += chunk_size
 
     def create(self, **fields):
         """Create a Resource.
 
         'fields' is the dict of kwargs to pass to create.
         Allows slighly nicer syntax than having to pass in a dict.
+
+        Fields the model doesn't have are left out, and PayloadError is
+        raised without calling Odoo if any values are of the wrong type.
         """
+        fields = self.schema.clean(fields)
+        self.invalidate([])
         return self.resource_env.create(fields)
 
+    def create_many(self, vals_list):
+        """Create several Resources, returning their ids in order.
+
+        'vals_list' is a list of field dicts, one per Resource.
+
+        Odoo 12+ creates them all in one call. If that fails (or on
+        older servers) they are created one at a time, so we can tell
+        which records are at fault. If any fail, BulkCreateError is
+        raised with the ids of those which were created.
+
+        Every record is cleaned against the model's schema first (as
+        for create), so a PayloadError means none were created.
+        """
+        vals_list = list(vals_list)
+        if not vals_list:
+            return []
+        schema = self.schema
+        vals_list = [schema.clean(vals) for vals in vals_list]
+        self.invalidate([])
+
+        if self.client.supports_create_multi:
+            try:
+                ids = self.resource_env.create(vals_list)
+                return ids if isinstance(ids, list) else [ids]
+            except RPCError:
+                # Nothing was created, so fall through to find the culprit.
+                pass
+
+        ids = []
+        errors = {}
+        for index, vals in enumerate(vals_list):
+            try:
+                ids.append(self.resource_env.create(vals))
+            except Exception as e:
+                ids.append(None)
+                errors[index] = e
+        if errors:
+            raise BulkCreateError(ids, errors)
+        return ids
+
+    def write(self, ids, vals, only_changed=True, current=None):
+        """Write 'vals' to 1 or more Resources in a single call.
+
+        'ids' can be 1 id, or a list of ids.
+        'vals' is the dict of field values to write.
+
+        With 'only_changed', fields which already hold the given value
+        are left out, and nothing is sent at all if none have changed.
+        The values are compared against 'current' (a browse record or
+        read dict, or a list of them) if given, otherwise they are read
+        in one call first.
+
+        Inside odooclient.transaction() the write is held back and sent
+        when the block exits.
+
+        Returns the dict of values written. Fields the model doesn't
+        have are left out, and PayloadError is raised without calling
+        Odoo if any values are of the wrong type.
+        """
+        ids = list(self._is_iterable(ids))
+        if not ids or not vals:
+            return {}
+        vals = self.schema.clean(vals)
+        if not vals:
+            return {}
+
+        transaction = self.client.current_transaction
+        if only_changed:
+            # Values waiting in a transaction aren't on the server yet,
+            # so those fields can't be compared and are always written.
+            pending = set()
+            if transaction is not None:
+                pending = transaction.pending_fields(self.model, ids)
+            if current is None:
+                current = self.resource_env.read(ids, fields=list(vals))
+            elif isinstance(current, dict):
+                current = [current]
+            vals = dict(
+                (name, value) for name, value in vals.items()
+                if name in pending or
+                any(_is_changed(record, name, value) for record in current))
+            if not vals:
+                return {}
+
+        if transaction is not None:
+            transaction.write(self, ids, vals)
+        else:
+            self.resource_env.write(ids, vals)
+        self.invalidate(ids)
+        return vals
+
     def load(self, fields, rows):
         """Loads in a Resource.
 
         'fields' is a list of fields to import. - list(str)
         'rows' is the item data. - list(list(str))
         """
-        return self.resource_env.load(fields=fields, data=rows)
+        self.invalidate()
+        response = self.resource_env.load(fields=fields, data=rows)
+        self.invalidate(response.get('ids') or [])
+        return response
+
+    def load_stream(self, fields, rows, chunk_size=DEFAULT_CHUNK_SIZE,
+                    workers=1, skip_chunks=(), pool=None):
+        """Load rows from an iterable in chunks, returning a LoadResult.
+
+        'fields' is a list of fields to import. - list(str)
+        'rows' is an iterable (e.g. a generator) of item data rows.
+
+        Only a few chunks are held in memory at once. With more than 1
+        worker, chunks are loaded in parallel over extra clients taken
+        from 'pool' (the shared client pool by default), so be wary of
+        how many workers Odoo can spare.
+
+        A failed chunk doesn't stop the load. Chunks whose index is in
+        'skip_chunks' are read past but not loaded, for resuming from
+        an earlier LoadResult.
+        """
+        self.invalidate()
+        result = LoadResult()
+        skip_chunks = set(skip_chunks)
+        rows = iter(rows)
+
+        def iter_chunks():
+            for index in itertools.count():
+                chunk = list(itertools.islice(rows, chunk_size))
+                if not chunk:
+                    return
+                if index not in skip_chunks:
+                    yield index, index * chunk_size, chunk
+
+        def load_chunk(client, index, first_row, chunk):
+            try:
+                response = client.get_model(self.model).load(
+                    fields=fields, data=chunk)
+            except Exception as e:
+                LOG.warning("Loading chunk %s of %s failed: %s"
+                            % (index, self.model, e))
+                result.add_error(index, e)
+            else:
+                self.invalidate(response.get('ids') or [])
+                result.add(index, first_row, response)
+
+        if workers <= 1:
+            for chunk in iter_chunks():
+                load_chunk(self.client, *chunk)
+            return result
+
+        if pool is None:
+            from odoo_actions.odoo_client import get_client_pool
+            pool = get_client_pool()
+
+        chunks = queue.Queue(maxsize=workers * 2)
+
+        def work(client):
+            while True:
+                chunk = chunks.get()
+                if chunk is None:
+                    return
+                load_chunk(client, *chunk)
+
+        def pooled_work():
+            # Don't wait for a client: our own keeps the load going.
+            try:
+                client = pool.checkout(timeout=0)
+            except PoolTimeout:
+                LOG.warning("No spare Odoo client for a load worker.")
+                return
+            try:
+                work(client)
+            finally:
+                pool.checkin(client)
+
+        # Our own client is always one of the workers, so the load goes
+        # ahead even if the pool has no clients to spare.
+        threads = [threading.Thread(target=work, args=(self.client, ))]
+        threads.extend(threading.Thread(target=pooled_work)
+                       for _ in range(workers - 1))
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        try:
+            for chunk in iter_chunks():
+                chunks.put(chunk)
+        finally:
+            for _ in threads:
+                chunks.put(None)
+            for thread in threads:
+                thread.join()
+        return result
 
     def delete(self, ids):
         """Delete 1 or more Resources by id.
@@ -73,4 +720,9 @@ class BaseManager(object):
 
         returns True if deleted or not present.
         """
-        return self.resource_env.unlink(self._is_iterable(ids))
+        ids = self._is_iterable(ids)
+        self.invalidate(ids)
+        result = self.resource_env.unlink(ids)
+        # Again, for reads made while the unlink was in progress.
+        self.invalidate(ids)
+        return result
@@ -12,10 +12,19 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+from . import country_index
 from .common import BaseManager
 
 
 class CountryManager(BaseManager):
+    """res.country, looked up from the process-wide country index.
+
+    The index is loaded with one read on first use and then kept
+    current in the background (see country_index), so reads of the
+    default fields, and the lookups below, make no calls to Odoo.
+    """
+
+    model = 'res.country'
 
     fields = [
         'id',
@@ -23,40 +32,63 @@ class CountryManager(BaseManager):
         'code',
     ]
 
-    def __init__(self, odooclient):
-        self.client = odooclient
-        self.resource_env = self.client._Country
+    index = country_index.countries
 
-    def fuzzy_match(self, code, threshold=0.8):
-        """Will find near matches
+    def _read_all(self):
+        return self.list([], read=True)
 
-        Returns: list(dict())
-            [{'id': 1, 'name': "bob", "match": 0.8}, ]
+    def load_index(self):
+        """(Re)load the country index from Odoo."""
+        self.index.load(self._read_all(), self.client.country_aliases)
 
-        This needs to be properly implented Odoo side.
-        """
+    def _load_index_once(self):
+        self.index.load_once(self._read_all, self.client.country_aliases)
 
-        search = [
-            ('code', '=ilike', code)
-        ]
+    def _index_rows(self, ids):
+        """Rows for 'ids' from the index, or None if any are missing."""
+        self._load_index_once()
+        rows = [self.index.by_id(res_id) for res_id in ids]
+        if None in rows:
+            return None
+        return [dict(row) for row in rows]
 
-        # Should be a server side call to:
-        # self.resource_env.fuzzy_match(<args>)
-        countries = self.list(search)
+    def get(self, ids, read=False, fields=None, compact=False,
+            include=None):
+        """As BaseManager.get, but reads of the default fields are
+        answered from the index.
 
-        matches = []
-        for country in countries:
-            matches.append({
-                'id': country.id,
-                'name': country.name,
-                # Odoo will give us this value eventually, for now
-                # we hardcode it to 1 because these are exact matches.
-                'match': 1
-            })
+        Countries added since the index was loaded are read from Odoo.
+        """
+        if ((read or compact) and not include and
+                set(fields or self.fields) <= set(self.fields)):
+            rows = self._index_rows(self._is_iterable(ids))
+            if rows is not None:
+                return self._finish_rows(
+                    rows, fields or self.fields, compact, None)
+        return super(CountryManager, self).get(
+            ids, read=read, fields=fields, compact=compact, include=include)
 
-        return matches
+    def fuzzy_match(self, code, threshold=0.8):
+        """Will find near matches
+
+        'code' is compared against each country's ISO alpha-2 and
+        alpha-3 codes, its name and its configured aliases.
+
+        Returns: list(dict()), best match first
+            [{'id': 1, 'name': "bob", "match": 0.8}, ]
+        """
+        self._load_index_once()
+        return [{
+            'id': country['id'],
+            'name': country['name'],
+            'match': score,
+        } for country, score in self.index.match(code, threshold)]
 
     def get_closest_country(self, code):
+        """The closest match for 'code', as a compact record.
+
+        Raises IndexError if there is no match.
+        """
         matches = self.fuzzy_match(code)
 
-        return self.get(matches[0]['id'])[0]
+        return self.get(matches[0]['id'], compact=True)[0]
@@ -0,0 +1,160 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""An in-process copy of res.country.
+
+The table is small and almost never changes, so CountryManager loads it
+once per process and answers lookups by id, code or name from memory.
+Fuzzy matches are scored against an n-gram index of each country's
+ISO alpha-2 and alpha-3 codes, its name, and any aliases configured in
+the 'country_aliases' setting:
+
+    country_aliases:
+        GB: [UK, Great Britain, England]
+        NZ: [Aotearoa]
+
+A CountryIndexRefresher thread reloads it every
+'country_refresh_interval' seconds, so a country added in Odoo shows up
+without a restart.
+"""
+
+import logging
+import threading
+import time
+
+from .ngrams import NgramIndex, normalize
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 60 * 60
+
+
+def alpha3(code):
+    """The ISO 3166-1 alpha-3 code for the alpha-2 'code', if known."""
+    from django_countries import countries as iso_countries
+    return iso_countries.alpha3(code) or None
+
+
+class CountryIndex(object):
+    """Country rows (as read dicts) by id, code and name."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (by_id, by_code, by_name, ngram index), swapped in whole so
+        # readers never see a half loaded index.
+        self._tables = None
+        self.loaded_at = None
+
+    @property
+    def loaded(self):
+        return self._tables is not None
+
+    def load(self, rows, aliases=None):
+        """Index 'rows', with the extra names in 'aliases' (a dict of
+        lists, by alpha-2 code)."""
+        aliases = dict((code.upper(), names)
+                       for code, names in (aliases or {}).items())
+        by_id, by_code, by_name = {}, {}, {}
+        names = NgramIndex()
+        for row in rows:
+            row = dict(row)
+            by_id[row['id']] = row
+            code = (row.get('code') or "").upper()
+            texts = [row.get('name')] + list(aliases.get(code, ()))
+            if code:
+                codes = [code, alpha3(code)]
+                for country_code in codes:
+                    if country_code:
+                        by_code[country_code] = row
+                texts.extend(codes)
+            for text in texts:
+                if text:
+                    by_name.setdefault(normalize(text), row)
+                    names.add(row['id'], text)
+        self._tables = (by_id, by_code, by_name, names)
+        self.loaded_at = time.time()
+
+    def load_once(self, fetch, aliases=None):
+        """Load the rows 'fetch' returns, unless already loaded."""
+        if self.loaded:
+            return
+        with self._lock:
+            if not self.loaded:
+                self.load(fetch(), aliases)
+
+    def rows(self):
+        return list(self._tables[0].values()) if self.loaded else []
+
+    def by_id(self, country_id):
+        return self._tables[0].get(country_id) if self.loaded else None
+
+    def by_code(self, code):
+        return self._tables[1].get(code.upper()) if self.loaded else None
+
+    def by_name(self, name):
+        """The country with 'name' (or an alias of it), ignoring case,
+        accents and punctuation."""
+        return (self._tables[2].get(normalize(name))
+                if self.loaded else None)
+
+    def match(self, text, threshold=0.0, limit=None):
+        """Countries whose codes, name or aliases are like 'text'.
+
+        Returns [(row, score)], best first.
+        """
+        if not self.loaded:
+            return []
+        by_id, names = self._tables[0], self._tables[3]
+        return [(by_id[country_id], score) for country_id, score
+                in names.search(text, threshold, limit)]
+
+    def clear(self):
+        self._tables = None
+        self.loaded_at = None
+
+    def reset(self):
+        """Forget a lock held by threads lost in a fork."""
+        self._lock = threading.Lock()
+
+
+# Shared by every client in the process.
+countries = CountryIndex()
+
+
+class CountryIndexRefresher(threading.Thread):
+    """Background thread which periodically reloads the country index
+    with a client from the pool."""
+
+    def __init__(self, pool, interval=DEFAULT_REFRESH_INTERVAL):
+        super(CountryIndexRefresher, self).__init__(
+            name="odoo-country-refresh")
+        self.daemon = True
+        self.pool = pool
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def refresh(self):
+        with self.pool.client() as client:
+            client.countries.load_index()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.refresh()
+            except Exception:
+                LOG.exception("Refreshing the Odoo country index failed.")
+
+    def stop(self):
+        self._stopped.set()
@@ -18,6 +18,4 @@ from .common import BaseManager
 
 class CloudCreditManager(BaseManager):
 
-    def __init__(self, odooclient):
-        self.client = odooclient
-        self.resource_env = self.client._Credit
+    model = 'cloud.credit'
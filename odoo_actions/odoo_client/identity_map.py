@@ -0,0 +1,151 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Request scoped identity map for Odoo records.
+
+Within a scope, BaseManager.get and list hand back the records already
+loaded in that scope rather than fetching them again, and identical
+searches are only sent once. Writes, creates and deletes made through
+the managers drop what they may have changed.
+
+The scope is per thread, and is set up for each request by
+odoo_views.middleware.OdooIdentityMapMiddleware:
+
+    with identity_map.scope():
+        ...
+"""
+
+import threading
+from contextlib import contextmanager
+
+
+_local = threading.local()
+
+
+class IdentityMap(object):
+    """Records and search results loaded so far, by model."""
+
+    def __init__(self):
+        # {(model, id): browse record}
+        self._records = {}
+        # {(model, id): read dict}
+        self._rows = {}
+        # (model, id) of rows read with every field.
+        self._complete_rows = set()
+        # {(model, search key): [ids]}
+        self._searches = {}
+
+    def get_records(self, model, ids):
+        """Browse records for 'ids', or None if any aren't loaded."""
+        try:
+            return [self._records[(model, res_id)] for res_id in ids]
+        except KeyError:
+            return None
+
+    def add_records(self, model, records):
+        for record in records:
+            self._records[(model, record.id)] = record
+
+    def get_rows(self, model, ids, fields):
+        """Copies of the read dicts for 'ids' with at least 'fields'
+        (None for every field), or None if any aren't loaded."""
+        rows = []
+        for res_id in ids:
+            key = (model, res_id)
+            row = self._rows.get(key)
+            if row is None:
+                return None
+            if fields is None:
+                if key not in self._complete_rows:
+                    return None
+            elif not all(name in row for name in fields):
+                return None
+            rows.append(dict(row))
+        return rows
+
+    def add_rows(self, model, rows, fields):
+        """Add read dicts, merging them into any we already have so
+        each record keeps a single dict.
+
+        Returns copies of the merged dicts, so callers changing them
+        don't change what later lookups in the scope see.
+        """
+        merged = []
+        for row in rows:
+            key = (model, row['id'])
+            if key in self._rows:
+                self._rows[key].update(row)
+            else:
+                self._rows[key] = dict(row)
+            if fields is None:
+                self._complete_rows.add(key)
+            merged.append(dict(self._rows[key]))
+        return merged
+
+    def get_search(self, model, key):
+        return self._searches.get((model, key))
+
+    def add_search(self, model, key, ids):
+        self._searches[(model, key)] = list(ids)
+
+    def invalidate(self, model, ids=None):
+        """Forget 'ids' of 'model' (or all of them), and its searches."""
+        if ids is not None:
+            ids = set(ids)
+        for store in (self._records, self._rows):
+            for key in list(store):
+                if key[0] == model and (ids is None or key[1] in ids):
+                    del store[key]
+        self._complete_rows = set(
+            key for key in self._complete_rows
+            if key[0] != model or (ids is not None and key[1] not in ids))
+        for key in list(self._searches):
+            if key[0] == model:
+                del self._searches[key]
+
+
+def current():
+    """The identity map for this thread's scope, or None."""
+    return getattr(_local, 'identity_map', None)
+
+
+@contextmanager
+def scope():
+    """Use one identity map for the duration of a 'with' block.
+
+    Nested scopes share the outermost one's map.
+    """
+    if current() is not None:
+        yield current()
+        return
+    _local.identity_map = IdentityMap()
+    try:
+        yield _local.identity_map
+    finally:
+        _local.identity_map = None
+
+
+@contextmanager
+def suspended():
+    """Step outside this thread's scope (if any) for a 'with' block.
+
+    For reads which shouldn't be held in the map, such as exporting a
+    whole table.
+    """
+    id_map = current()
+    _local.identity_map = None
+    try:
+        yield
+    finally:
+        _local.identity_map = id_map
@@ -0,0 +1,159 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Fuzzy string matching with character n-grams.
+
+Texts are normalised (lower case, accents and punctuation dropped) and
+padded with a space at each end, then broken into the set of their n
+character substrings. Two texts score the Dice coefficient of their
+sets: 1.0 for the same normalised text, down to 0.0 for nothing in
+common.
+
+NgramIndex keeps an inverted index from n-gram to texts, so a search
+only scores texts sharing enough of the query's rarer n-grams to reach
+its threshold.
+"""
+
+import math
+import re
+import unicodedata
+
+try:
+    text_type = unicode  # noqa: F821
+except NameError:
+    text_type = str
+
+
+DEFAULT_N = 3
+
+_NON_WORD = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text_type(text))
+    text = u"".join(c for c in text if not unicodedata.combining(c))
+    return u" ".join(_NON_WORD.sub(u" ", text.lower()).split())
+
+
+def ngrams(text, n=DEFAULT_N):
+    """The set of n-grams of 'text', once normalised."""
+    text = u" %s " % normalize(text)
+    if len(text) <= n:
+        return frozenset([text])
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+class NgramIndex(object):
+    """Texts indexed by n-gram, each filed under a key.
+
+    A key can have several texts (e.g. a country's code, name and
+    aliases), and scores as the best of them.
+
+    Not safe to change while other threads search it; build a new index
+    and swap it in, or lock around changes.
+    """
+
+    def __init__(self, n=DEFAULT_N):
+        self.n = n
+        # {ngram: set((key, text))}
+        self._postings = {}
+        # {(key, text): ngrams}
+        self._grams = {}
+        # {key: set((key, text))}
+        self._entries = {}
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def add(self, key, text):
+        if not text:
+            return
+        entry = (key, normalize(text))
+        if entry in self._grams:
+            return
+        grams = ngrams(text, self.n)
+        self._grams[entry] = grams
+        self._entries.setdefault(key, set()).add(entry)
+        for gram in grams:
+            self._postings.setdefault(gram, set()).add(entry)
+
+    def remove(self, key):
+        """Drop every text filed under 'key'."""
+        for entry in self._entries.pop(key, ()):
+            for gram in self._grams.pop(entry):
+                postings = self._postings[gram]
+                postings.discard(entry)
+                if not postings:
+                    del self._postings[gram]
+
+    def _candidates(self, grams, threshold):
+        """Texts which could score 'threshold' against 'grams'.
+
+        Any such text shares at least threshold * len / (2 - threshold)
+        of the query's n-grams, so it must have one of the rest: we only
+        go through the postings of that many of the rarest n-grams.
+        """
+        postings = sorted(
+            (self._postings.get(gram, ()) for gram in grams), key=len)
+        min_shared = int(math.ceil(
+            len(grams) * threshold / (2 - threshold) - 1e-9))
+        candidates = set()
+        for entries in postings[:max(len(postings) - min_shared + 1, 1)]:
+            candidates.update(entries)
+        return candidates
+
+    def search(self, text, threshold=0.0, limit=None, keys=None):
+        """Keys with a text scoring at least 'threshold' against 'text'.
+
+        If 'keys' is given only those keys are scored, which is quicker
+        than going through the postings when there are only a few.
+
+        Returns [(key, score)], best first, and by key among equal
+        scores so the order doesn't depend on hashing.
+        """
+        grams = ngrams(text, self.n)
+        if keys is not None:
+            candidates = set()
+            for key in keys:
+                candidates.update(self._entries.get(key, ()))
+        else:
+            candidates = self._candidates(grams, threshold)
+
+        # A text of 'size' n-grams can only score 'threshold' if it is
+        # within these sizes.
+        min_size = len(grams) * threshold / (2 - threshold)
+        max_size = len(grams) * (2 - threshold) / threshold if threshold \
+            else float('inf')
+
+        scores = {}
+        for entry in candidates:
+            entry_grams = self._grams[entry]
+            if not min_size <= len(entry_grams) <= max_size:
+                continue
+            count = len(grams & entry_grams)
+            if not count:
+                continue
+            score = 2.0 * count / (len(grams) + len(entry_grams))
+            key = entry[0]
+            if score >= threshold and score > scores.get(key, 0.0):
+                scores[key] = score
+
+        matches = sorted(
+            scores.items(), key=lambda match: (-match[1], match[0]))
+        if limit is not None:
+            matches = matches[:limit]
+        return matches
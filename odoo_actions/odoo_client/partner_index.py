@@ -0,0 +1,145 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""An in-process index of partner names, for fuzzy matching.
+
+If the 'partner_index' setting is on, it is built in the background from
+one export of res.partner (a page of search_read at a time) once a
+process has its client pool, then is kept current by partner_sync. Names
+are kept in trigram indexes, one for companies and one for contacts,
+with contacts also filed by their parent so looking for a company's
+contacts only scores that company's.
+"""
+
+import threading
+
+from .ngrams import NgramIndex
+
+
+# The fields exported to build the index.
+FIELDS = ['id', 'name', 'is_company', 'parent_id']
+
+
+def _parent_id(row):
+    parent = row.get('parent_id')
+    if isinstance(parent, (list, tuple)):
+        parent = parent[0]
+    return parent or None
+
+
+class PartnerIndex(object):
+    """Partner names by company flag and parent."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # {id: (name, is_company, parent_id)}
+        self._partners = {}
+        # {is_company: NgramIndex of names by id}
+        self._names = {True: NgramIndex(), False: NgramIndex()}
+        # {parent_id: set(ids)}, None for partners without a parent.
+        self._children = {}
+
+    def __len__(self):
+        return len(self._partners)
+
+    def __contains__(self, partner_id):
+        return partner_id in self._partners
+
+    def _add(self, row):
+        partner = (row.get('name') or "", bool(row.get('is_company')),
+                   _parent_id(row))
+        self._partners[row['id']] = partner
+        self._names[partner[1]].add(row['id'], partner[0])
+        self._children.setdefault(partner[2], set()).add(row['id'])
+
+    def _remove(self, partner_id):
+        partner = self._partners.pop(partner_id, None)
+        if partner is None:
+            return
+        self._names[partner[1]].remove(partner_id)
+        children = self._children[partner[2]]
+        children.discard(partner_id)
+        if not children:
+            del self._children[partner[2]]
+
+    def load(self, rows):
+        """Replace the index with 'rows' (read dicts of FIELDS)."""
+        index = PartnerIndex()
+        for row in rows:
+            index._add(row)
+        with self._lock:
+            self._partners = index._partners
+            self._names = index._names
+            self._children = index._children
+
+    def update(self, rows):
+        """Add or replace the partners in 'rows'."""
+        with self._lock:
+            for row in rows:
+                self._remove(row['id'])
+                self._add(row)
+
+    def remove(self, partner_ids):
+        with self._lock:
+            for partner_id in partner_ids:
+                self._remove(partner_id)
+
+    def _match(self, name, is_company=False, check_parent=False,
+               parent=None, threshold=0.0, limit=None):
+        is_company = bool(is_company)
+        names = self._names[is_company]
+        keys = None
+        if check_parent:
+            keys = [partner_id
+                    for partner_id in self._children.get(parent or None, ())
+                    if self._partners[partner_id][1] == is_company]
+        return [(partner_id, self._partners[partner_id][0], score)
+                for partner_id, score
+                in names.search(name, threshold, limit, keys)]
+
+    def match(self, name, is_company=False, check_parent=False, parent=None,
+              threshold=0.0, limit=None):
+        """Partners with names like 'name'.
+
+        With 'check_parent', only the partners whose parent is 'parent'
+        are scored.
+
+        Returns [(id, name, score)], best first.
+        """
+        with self._lock:
+            return self._match(
+                name, is_company, check_parent, parent, threshold, limit)
+
+    def match_many(self, queries):
+        """match() for each of 'queries', dicts of its arguments.
+
+        All are matched against the same state of the index, and each
+        distinct query only once. Returns a list of matches per query.
+        """
+        results = {}
+        with self._lock:
+            for query in queries:
+                key = tuple(sorted(query.items()))
+                if key not in results:
+                    results[key] = self._match(**query)
+        return [list(results[tuple(sorted(query.items()))])
+                for query in queries]
+
+    def reset(self):
+        """Forget a lock held by threads lost in a fork."""
+        self._lock = threading.Lock()
+
+
+# Shared by every client in the process.
+partners = PartnerIndex()
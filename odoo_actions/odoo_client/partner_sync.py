@@ -0,0 +1,267 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Keeps in-process partner indexes current without rebuilding them.
+
+The first sync exports every partner. After that, each sync only reads
+the partners written since a little before the latest write_date seen
+(the high-water mark), including ones archived since, and applies them
+to the indexes.
+Deleted partners don't show up that way, so every
+'partner_deletion_check_interval' seconds we also search for all the
+partner ids and drop any we have which are gone.
+
+If the 'partner_index' setting is on, a PartnerSyncer thread does the
+first sync as soon as the process's client pool is set up, then syncs
+every 'partner_sync_interval' seconds to pick up changes made elsewhere.
+Lookups also pull the latest changes first (see pull()), and changes
+this process makes itself are applied straight away, through apply() and
+remove().
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from . import identity_map
+from . import partner_index
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_SYNC_INTERVAL = 60
+DEFAULT_DELETION_CHECK_INTERVAL = 10 * 60
+DEFAULT_PULL_MAX_AGE = 1
+DEFAULT_SYNC_OVERLAP = 60
+
+# Odoo's format for write_date.
+DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# The fields read for each partner.
+FIELDS = partner_index.FIELDS + ['active', 'write_date']
+
+
+class PartnerSync(object):
+    """The sync state of a set of partner indexes.
+
+    Each index needs load(rows), update(rows) and remove(ids) methods,
+    as PartnerIndex has.
+
+    Only one thread reads changes from Odoo at a time, but the indexes
+    are only locked while the changes are applied, so lookups and
+    apply() never wait on a call to Odoo.
+    """
+
+    def __init__(self, indexes=(),
+                 deletion_check_interval=DEFAULT_DELETION_CHECK_INTERVAL,
+                 pull_max_age=DEFAULT_PULL_MAX_AGE,
+                 overlap=DEFAULT_SYNC_OVERLAP):
+        self.indexes = list(indexes)
+        self.deletion_check_interval = deletion_check_interval
+        self.pull_max_age = pull_max_age
+        self.overlap = overlap
+        # Held while changing the indexes and the state below.
+        self._lock = threading.Lock()
+        # Held while reading from Odoo.
+        self._sync_lock = threading.Lock()
+        # The ids in the indexes, or None before the first sync.
+        self._ids = None
+        self.high_water = None
+        self.synced_at = None
+        self.checked_deletions_at = None
+
+    @property
+    def loaded(self):
+        return self._ids is not None
+
+    def _read(self, manager, filters):
+        return list(manager.iter_list(filters, fields=FIELDS))
+
+    def _advance(self, rows):
+        for row in rows:
+            write_date = row.get('write_date')
+            if write_date and (self.high_water is None or
+                               write_date > self.high_water):
+                self.high_water = write_date
+
+    def _pull_from(self):
+        """The write_date to read changes from: 'overlap' seconds
+        before the high-water mark.
+
+        A partner's write_date is set when its transaction starts, so
+        one committed after we've read past it (e.g. by a long
+        transaction) is still read as long as that took less than
+        'overlap' seconds. write_date only has seconds, so this also
+        rereads writes made later in the last second seen.
+        """
+        try:
+            high_water = datetime.strptime(
+                self.high_water[:19], DATETIME_FORMAT)
+        except ValueError:
+            return self.high_water
+        return (high_water - timedelta(seconds=self.overlap)).strftime(
+            DATETIME_FORMAT)
+
+    def _apply_rows(self, rows):
+        """Apply read rows, dropping any which are archived."""
+        self._apply(
+            [row for row in rows if row.get('active', True)],
+            set(row['id'] for row in rows if not row.get('active', True)))
+
+    def _apply(self, rows, removed_ids):
+        for index in self.indexes:
+            if rows:
+                index.update(rows)
+            if removed_ids:
+                index.remove(removed_ids)
+        self._ids.update(row['id'] for row in rows)
+        self._ids.difference_update(removed_ids)
+
+    def _load(self, manager):
+        rows = self._read(manager, [])
+        with self._lock:
+            for index in self.indexes:
+                index.load(rows)
+            self._ids = set(row['id'] for row in rows)
+            self.high_water = None
+            self._advance(rows)
+            self.synced_at = self.checked_deletions_at = time.time()
+        LOG.info("Loaded %s partners, written up to %s."
+                 % (len(rows), self.high_water))
+
+    def _pull_changes(self, manager):
+        filters = [('active', 'in', [True, False])]
+        if self.high_water:
+            filters.append(('write_date', '>=', self._pull_from()))
+        rows = self._read(manager, filters)
+        with self._lock:
+            self._apply_rows(rows)
+            self._advance(rows)
+            self.synced_at = time.time()
+
+    def _check_deletions(self, manager):
+        with identity_map.suspended():
+            ids = set(manager.list([], get=False))
+        with self._lock:
+            removed = self._ids - ids
+            # Anything we missed, e.g. unarchived with an old write_date.
+            added = ids - self._ids
+        rows = []
+        if added:
+            rows = self._read(manager, [('id', 'in', sorted(added))])
+        with self._lock:
+            self._apply(rows, removed)
+            self.checked_deletions_at = time.time()
+        if removed or added:
+            LOG.info("Partner id check dropped %s and added %s partners."
+                     % (len(removed), len(added)))
+
+    def sync(self, manager):
+        """Bring the indexes up to date, reading through 'manager'.
+
+        The first sync loads everything, later ones only the changes.
+        """
+        with self._sync_lock:
+            if not self.loaded:
+                self._load(manager)
+                return
+            self._pull_changes(manager)
+            if (time.time() >= self.checked_deletions_at +
+                    self.deletion_check_interval):
+                self._check_deletions(manager)
+
+    def _is_fresh(self):
+        return time.time() < self.synced_at + self.pull_max_age
+
+    def pull(self, manager):
+        """Apply the changes since the last sync, before a lookup.
+
+        Only the partners written since the high-water mark (less the
+        overlap) are read, and not at all if the indexes were synced in
+        the last 'pull_max_age' seconds or another thread is already
+        reading changes. Does nothing before the first sync, which is
+        left to the PartnerSyncer as it reads every partner.
+        """
+        if not self.loaded or self._is_fresh():
+            return
+        if not self._sync_lock.acquire(False):
+            return
+        try:
+            if not self._is_fresh():
+                self._pull_changes(manager)
+        finally:
+            self._sync_lock.release()
+
+    def apply(self, rows):
+        """Apply partners just created or written by this process.
+
+        'rows' are dicts of (at least) the index FIELDS, and those with
+        'active' False are dropped. The high-water mark is left alone,
+        so the next sync still reads whatever was written elsewhere
+        meanwhile.
+
+        Does nothing before the first sync, which will read them.
+        """
+        if not self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                self._apply_rows(list(rows))
+
+    def remove(self, partner_ids):
+        """Drop partners just deleted by this process."""
+        if not self.loaded:
+            return
+        with self._lock:
+            if self.loaded:
+                self._apply([], set(partner_ids))
+
+    def reset(self):
+        """Forget locks held by threads lost in a fork."""
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+
+# Shared by every client in the process.
+partners = PartnerSync([partner_index.partners])
+
+
+class PartnerSyncer(threading.Thread):
+    """Background thread which syncs the partner indexes with a client
+    from the pool, straight away and then every 'interval' seconds."""
+
+    def __init__(self, pool, interval=DEFAULT_SYNC_INTERVAL):
+        super(PartnerSyncer, self).__init__(name="odoo-partner-sync")
+        self.daemon = True
+        self.pool = pool
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def sync(self):
+        with self.pool.client() as client:
+            client.partners.sync_index()
+
+    def run(self):
+        # The first sync loads the indexes, so is done straight away.
+        while True:
+            try:
+                self.sync()
+            except Exception:
+                LOG.exception("Syncing the Odoo partner indexes failed.")
+            if self._stopped.wait(self.interval):
+                return
+
+    def stop(self):
+        self._stopped.set()
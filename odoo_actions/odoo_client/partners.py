@@ -12,11 +12,19 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
-from .common import BaseManager
+from . import partner_index
+from . import partner_sync
+from .common import BaseManager, BulkCreateError
+
+
+# Changes to these fields are applied to the partner index.
+INDEXED_FIELDS = frozenset(['name', 'is_company', 'parent_id', 'active'])
 
 
 class PartnerManager(BaseManager):
 
+    model = 'res.partner'
+
     fields = [
         'id',
         'name',
@@ -30,43 +38,116 @@ class PartnerManager(BaseManager):
         'country_id'
     ]
 
-    def __init__(self, odooclient):
-        self.client = odooclient
-        self.resource_env = self.client._Partner
+    index = partner_index.partners
+    # Keeps the index current.
+    sync = partner_sync.partners
+
+    @property
+    def fiscal_position_field(self):
+        """The partner fiscal position field, renamed in Odoo 9."""
+        if 'property_account_position_id' in self.schema:
+            return 'property_account_position_id'
+        return 'property_account_position'
+
+    def sync_index(self):
+        """Apply partner changes since the last sync to the index."""
+        self.sync.sync(self)
+
+    def _index_created(self, vals_list, ids):
+        """Add partners we just created to the index, so they can be
+        matched without waiting for the next sync."""
+        self.sync.apply(
+            dict(vals, id=partner_id)
+            for vals, partner_id in zip(vals_list, ids) if partner_id)
+
+    def create(self, **fields):
+        partner_id = super(PartnerManager, self).create(**fields)
+        self._index_created([fields], [partner_id])
+        return partner_id
+
+    def create_many(self, vals_list):
+        vals_list = list(vals_list)
+        try:
+            ids = super(PartnerManager, self).create_many(vals_list)
+        except BulkCreateError as e:
+            self._index_created(vals_list, e.ids)
+            raise
+        self._index_created(vals_list, ids)
+        return ids
+
+    def write(self, ids, vals, only_changed=True, current=None):
+        ids = list(self._is_iterable(ids))
+        written = super(PartnerManager, self).write(
+            ids, vals, only_changed=only_changed, current=current)
+        # Writes held in a transaction are picked up by a later pull,
+        # once sent.
+        if (self.sync.loaded and INDEXED_FIELDS.intersection(written) and
+                self.client.current_transaction is None):
+            self.sync.apply(
+                self.resource_env.read(ids, fields=partner_sync.FIELDS))
+        return written
+
+    def delete(self, ids):
+        ids = list(self._is_iterable(ids))
+        result = super(PartnerManager, self).delete(ids)
+        self.sync.remove(ids)
+        return result
+
+    def _exact_match(self, name, is_company=False, check_parent=False,
+                     parent=None, threshold=None):
+        search = [
+            ('is_company', '=', is_company),
+            ('name', '=', name)
+        ]
+        if check_parent:
+            search.append(('parent_id', '=', parent))
+        return [{
+            'id': partner['id'],
+            'name': partner['name'],
+            'match': 1,
+        } for partner in self.list(search, read=True, fields=['name'])]
 
     def fuzzy_match(self, name, is_company=False, check_parent=False,
                     parent=None, threshold=0.8):
         """Will find near matches
 
-        Returns: list(dict())
-            [{'id': 1, 'name': "bob", "match": 0.8}, ]
+        Names are scored by their trigrams (see ngrams), against the
+        process-wide partner index, which is loaded in the background
+        and kept in sync with Odoo (see partner_sync). If the index is
+        turned off, or until it has been loaded, only exact matches are
+        found, by searching Odoo.
 
-        This needs to be properly implented Odoo side.
+        Returns: list(dict()), best match first
+            [{'id': 1, 'name': "bob", "match": 0.8}, ]
         """
+        return self.fuzzy_match_many([{
+            'name': name,
+            'is_company': is_company,
+            'check_parent': check_parent,
+            'parent': parent,
+            'threshold': threshold,
+        }])[0]
 
-        search = [
-            ('is_company', '=', is_company),
-            ('name', '=', name)
-        ]
-
-        if check_parent:
-            search.append(('parent_id', '=', parent))
+    def fuzzy_match_many(self, queries):
+        """fuzzy_match for several names at once.
 
-        # Should be a server side call to:
-        # self.resource_env.fuzzy_match(<args>)
-        customers = self.list(search)
+        'queries' is a list of dicts of fuzzy_match's arguments, e.g.
+            [{'name': "bob", 'check_parent': True, 'parent': 3}, ]
 
-        matches = []
-        for customer in customers:
-            matches.append({
-                'id': customer.id,
-                'name': customer.name,
-                # Odoo will give us this value eventually, for now
-                # we hardcode it to 1 because these are exact matches.
-                'match': 1
-            })
-
-        return matches
+        Returns a list of matches for each query, in the same order.
+        """
+        if not self.sync.loaded:
+            return [self._exact_match(**query) for query in queries]
+        self.sync.pull(self)
+        queries = [dict({'threshold': 0.8}, **query) for query in queries]
+        results = []
+        for matches in self.index.match_many(queries):
+            results.append([{
+                'id': partner_id,
+                'name': partner_name,
+                'match': score,
+            } for partner_id, partner_name, score in matches])
+        return results
 
     def add_internal_note(self, partner_id, message_body, **kwargs):
         """Set a note on the given partner"""
@@ -83,3 +164,5 @@ class PartnerManager(BaseManager):
         }
         body.update(kwargs)
         self.client._MailMessage.create(body)
+        # The partner's message_ids have changed.
+        self.invalidate([partner_id])
@@ -0,0 +1,163 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZE = 4
+DEFAULT_POOL_TIMEOUT = 30
+DEFAULT_HEALTH_CHECK_INTERVAL = 60
+
+
+class PoolTimeout(Exception):
+    """No Odoo client became available before the wait timed out."""
+
+
+class ClientPool(object):
+    """A bounded pool of authenticated Odoo clients.
+
+    Clients are built on demand by 'factory' up to 'size', and are
+    handed out to one thread at a time via checkout/checkin. When all
+    clients are in use, checkout waits up to 'timeout' seconds for one
+    to be checked back in before raising PoolTimeout.
+
+    Idle clients are reused most recently used first, so the sessions
+    we hand out are the ones most likely to still be warm.
+    """
+
+    def __init__(self, factory, size=DEFAULT_POOL_SIZE,
+                 timeout=DEFAULT_POOL_TIMEOUT):
+        if size < 1:
+            raise ValueError("Pool size must be at least 1.")
+        self._factory = factory
+        self.size = size
+        self.timeout = timeout
+
+        self._condition = threading.Condition(threading.Lock())
+        self._idle = []
+        self._created = 0
+
+    def checkout(self, timeout=None):
+        """Take a client out of the pool, building one if allowed.
+
+        Raises PoolTimeout if no client is free within 'timeout'
+        seconds (defaults to the pool's timeout).
+        """
+        if timeout is None:
+            timeout = self.timeout
+        deadline = time.time() + timeout
+
+        with self._condition:
+            while not self._idle and self._created >= self.size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "No Odoo client available after %ss (pool size %s)."
+                        % (timeout, self.size))
+                self._condition.wait(remaining)
+
+            if self._idle:
+                return self._idle.pop()
+            self._created += 1
+
+        # Build outside the lock so a slow login doesn't block checkins.
+        try:
+            return self._factory()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def checkin(self, client):
+        """Return a client to the pool for reuse."""
+        with self._condition:
+            self._idle.append(client)
+            self._condition.notify()
+
+    def discard(self, client):
+        """Drop a client that should not be reused.
+
+        Frees its slot so a fresh client can be built in its place.
+        """
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._condition:
+            self._created -= 1
+            self._condition.notify()
+
+    @contextmanager
+    def client(self, timeout=None):
+        """Check out a client for the duration of a 'with' block."""
+        client = self.checkout(timeout)
+        try:
+            yield client
+        finally:
+            self.checkin(client)
+
+    def check_idle(self):
+        """Ping the clients which are currently idle.
+
+        Clients are taken out one at a time, least recently used first,
+        so the rest of the pool stays available while we check.
+        """
+        with self._condition:
+            count = len(self._idle)
+
+        for _ in range(count):
+            with self._condition:
+                if not self._idle:
+                    return
+                client = self._idle.pop(0)
+            try:
+                client.ping()
+            finally:
+                self.checkin(client)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    @property
+    def in_use(self):
+        return self._created - len(self._idle)
+
+
+class HealthChecker(threading.Thread):
+    """Background thread which periodically checks a pool's idle clients.
+
+    This lets sessions recover after an Odoo restart or session expiry
+    without waiting for user traffic to hit the broken connection.
+    """
+
+    def __init__(self, pool, interval=DEFAULT_HEALTH_CHECK_INTERVAL):
+        super(HealthChecker, self).__init__(name="odoo-client-health")
+        self.daemon = True
+        self.pool = pool
+        self.interval = interval
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.pool.check_idle()
+            except Exception:
+                LOG.exception("Odoo client health check failed.")
+
+    def stop(self):
+        self._stopped.set()
@@ -31,9 +31,17 @@ blacklisted_contact_types = [
 
 class ProjectRelationshipManager(BaseManager):
 
+    model = 'cloud.tenant_partner'
+
+    fields = [
+        'id',
+        'cloud_tenant',
+        'partner_id',
+        'contact_type',
+    ]
+
     def __init__(self, odooclient, contact_types_whitelist=None):
-        self.client = odooclient
-        self.resource_env = self.client._PartnerRelationship
+        super(ProjectRelationshipManager, self).__init__(odooclient)
 
         if contact_types_whitelist:
             self.contact_types_whitelist = contact_types_whitelist
@@ -4,6 +4,9 @@ from .common import BaseManager
 
 class CloudProjectManager(BaseManager):
 
-    def __init__(self, odooclient):
-        self.client = odooclient
-        self.resource_env = self.client._Project
+    model = 'cloud.tenant'
+
+    fields = [
+        'id',
+        'name',
+    ]
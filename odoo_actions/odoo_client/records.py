@@ -0,0 +1,93 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Compact record types for read results.
+
+A read dict costs a few hundred bytes per record before its values, and
+a browse record drags its environment along. For reports holding
+thousands of records, managers can instead return instances of a type
+generated from their fields, which only hold a slot per field:
+
+    partners = odooclient.partners.list([], compact=True)
+    partners[0].name, partners[0].country_id  # 'bob', (3, 'New Zealand')
+"""
+
+import threading
+
+
+class Record(object):
+    """Base for the generated record types."""
+
+    __slots__ = ()
+
+    # The fields of this record type, in order.
+    _fields = ()
+
+    def __init__(self, *values, **kwargs):
+        for name, value in zip(self._fields, values):
+            setattr(self, name, value)
+        for name, value in kwargs.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def from_row(cls, row, many2one=()):
+        """Build a record straight from a read dict.
+
+        Fields named in 'many2one' are unpacked into (id, name) pairs,
+        or are False if not set.
+        """
+        record = cls.__new__(cls)
+        for name in cls._fields:
+            value = row.get(name, False)
+            if value and name in many2one:
+                value = (value[0], value[1])
+            setattr(record, name, value)
+        return record
+
+    def as_dict(self):
+        return dict((name, getattr(self, name)) for name in self._fields)
+
+    def __eq__(self, other):
+        return (type(self) is type(other) and
+                all(getattr(self, name) == getattr(other, name)
+                    for name in self._fields))
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return "%s(%s)" % (type(self).__name__, ", ".join(
+            "%s=%r" % (name, getattr(self, name, None))
+            for name in self._fields))
+
+
+_record_types = {}
+_record_types_lock = threading.Lock()
+
+
+def record_type(name, fields):
+    """Get the record type called 'name' with slots for 'fields'.
+
+    Types are generated once and reused for the same name and fields.
+    """
+    fields = tuple(fields)
+    with _record_types_lock:
+        key = (name, fields)
+        if key not in _record_types:
+            _record_types[key] = type(
+                str(name), (Record, ),
+                {'__slots__': fields, '_fields': fields})
+        return _record_types[key]
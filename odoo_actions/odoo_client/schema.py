@@ -0,0 +1,229 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Cached model schemas, used to check payloads before sending them.
+
+Each model's fields_get is fetched once per process, and if the
+'schema_cache_dir' setting is given, kept on disk for later processes.
+Saved schemas are only used for the same Odoo server version, and are
+refetched once older than 'schema_cache_ttl' seconds, to pick up module
+upgrades.
+"""
+
+import difflib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+try:
+    string_types = (str, unicode)  # noqa: F821
+except NameError:
+    string_types = (str, )
+
+
+LOG = logging.getLogger(__name__)
+
+DEFAULT_SCHEMA_CACHE_TTL = 24 * 60 * 60
+
+# Python types we accept for each Odoo field type, besides False/None
+# which unset any field.
+NUMBER_TYPES = (int, float)
+FIELD_TYPES = {
+    'boolean': (bool, ),
+    'integer': (int, ),
+    'float': NUMBER_TYPES,
+    'monetary': NUMBER_TYPES,
+    'char': string_types,
+    'text': string_types,
+    'html': string_types,
+    'selection': string_types + (int, ),
+    'date': string_types,
+    'datetime': string_types,
+    'binary': string_types,
+    'reference': string_types,
+    'many2one': (int, ),
+    'one2many': (list, tuple),
+    'many2many': (list, tuple),
+}
+
+
+class PayloadError(ValueError):
+    """A create or write payload doesn't fit the model's schema.
+
+    'errors' maps each bad field to what is wrong with it.
+    """
+
+    def __init__(self, model, errors):
+        super(PayloadError, self).__init__(
+            "Invalid values for %s: %s" % (model, "; ".join(
+                "%s: %s" % (name, errors[name]) for name in sorted(errors))))
+        self.model = model
+        self.errors = errors
+
+
+class Schema(object):
+    """The fields of an Odoo model, as given by fields_get."""
+
+    def __init__(self, model, fields, version=None, fetched_at=None):
+        self.model = model
+        self.fields = fields
+        self.version = version
+        self.fetched_at = fetched_at or time.time()
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def _check_value(self, name, value):
+        field_type = self.fields[name].get('type')
+        if value is False or value is None:
+            return None
+        # bool is an int, but isn't a number to Odoo.
+        if isinstance(value, bool) and field_type != 'boolean':
+            return "expected %s, got a boolean" % field_type
+        types = FIELD_TYPES.get(field_type)
+        if types and not isinstance(value, types):
+            return "expected %s, got %s" % (field_type, type(value).__name__)
+        selection = self.fields[name].get('selection')
+        if (field_type == 'selection' and isinstance(selection, list) and
+                value not in [option[0] for option in selection]):
+            return "'%s' is not one of the options" % value
+        return None
+
+    def clean(self, vals):
+        """A copy of 'vals' without any fields the model doesn't have.
+
+        Odoo ignores unknown fields too, but we log a warning for each,
+        as they're usually a typo or a field dropped in a newer version.
+        Raises PayloadError if any values are of the wrong type.
+        """
+        cleaned = {}
+        errors = {}
+        for name, value in vals.items():
+            if name not in self.fields:
+                warning = "%s has no field '%s', leaving it out" % (
+                    self.model, name)
+                close = difflib.get_close_matches(name, self.fields, n=1)
+                if close:
+                    warning += " (did you mean '%s'?)" % close[0]
+                LOG.warning("%s." % warning)
+                continue
+            error = self._check_value(name, value)
+            if error:
+                errors[name] = error
+            cleaned[name] = value
+        if errors:
+            raise PayloadError(self.model, errors)
+        return cleaned
+
+    def as_dict(self):
+        return {
+            'model': self.model,
+            'fields': self.fields,
+            'version': self.version,
+            'fetched_at': self.fetched_at,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['model'], data['fields'],
+                   data.get('version'), data.get('fetched_at'))
+
+
+class SchemaStore(object):
+    """Schemas shared by every client in the process.
+
+    Looked up in memory, then on disk (if 'cache_dir' is set), and only
+    then fetched from Odoo.
+    """
+
+    def __init__(self, cache_dir=None, ttl=DEFAULT_SCHEMA_CACHE_TTL):
+        self.cache_dir = cache_dir
+        self.ttl = ttl
+        self._schemas = {}
+        self._lock = threading.Lock()
+
+    def _is_current(self, schema, version):
+        return (schema.version == version and
+                schema.fetched_at + self.ttl > time.time())
+
+    def _path(self, key):
+        name = re.sub(r'[^\w.-]', '_', "-".join(str(part) for part in key))
+        return os.path.join(self.cache_dir, "%s.json" % name)
+
+    def _load(self, key):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._path(key)) as schema_file:
+                return Schema.from_dict(json.load(schema_file))
+        except (IOError, OSError, ValueError, KeyError):
+            return None
+
+    def _save(self, key, schema):
+        if not self.cache_dir:
+            return
+        try:
+            if not os.path.isdir(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            # Write then rename, so other processes never read half a file.
+            fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir)
+            with os.fdopen(fd, 'w') as schema_file:
+                json.dump(schema.as_dict(), schema_file)
+            os.rename(tmp_path, self._path(key))
+        except (IOError, OSError) as e:
+            LOG.warning("Could not save the %s schema: %s"
+                        % (schema.model, e))
+
+    def get(self, key, model, version, fetch):
+        """The schema of 'model' for 'version', calling 'fetch' for its
+        fields_get if we don't have a current copy.
+
+        'key' identifies the server and database, as well as the model.
+        """
+        with self._lock:
+            schema = self._schemas.get(key)
+        if schema is not None and self._is_current(schema, version):
+            return schema
+
+        schema = self._load(key)
+        if schema is None or not self._is_current(schema, version):
+            schema = Schema(model, fetch(), version)
+            self._save(key, schema)
+
+        with self._lock:
+            self._schemas[key] = schema
+        return schema
+
+    def clear(self):
+        with self._lock:
+            self._schemas = {}
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_schema_store(conf):
+    """Get the process-wide SchemaStore for the odoo_client settings."""
+    cache_dir = conf.get('schema_cache_dir')
+    ttl = float(conf.get('schema_cache_ttl', DEFAULT_SCHEMA_CACHE_TTL))
+    with _stores_lock:
+        key = (cache_dir, ttl)
+        if key not in _stores:
+            _stores[key] = SchemaStore(cache_dir, ttl)
+        return _stores[key]
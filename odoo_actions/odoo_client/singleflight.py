@@ -0,0 +1,91 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Share one in-flight call between threads making the same call.
+
+    The first thread to make a call runs it. Any others making the same
+    call before it finishes wait, and get its result (or its error)
+    rather than making the call again.
+
+    Calls are grouped by model, and invalidating a model means calls
+    made after that don't join calls which started before it, so a
+    thread always sees its own writes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._generations = {}
+
+    def do(self, model, key, func, copy=None):
+        """Call 'func', or wait for the same call already in flight.
+
+        Threads which waited get 'copy(result)' if 'copy' is given, so
+        they don't share a mutable result with the thread which ran it.
+        """
+        with self._lock:
+            key = (model, self._generations.get(model, 0), key)
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            if copy is not None:
+                return copy(call.result)
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def generation(self, model):
+        """A count of how many times 'model' has been invalidated."""
+        with self._lock:
+            return self._generations.get(model, 0)
+
+    def invalidate(self, model):
+        with self._lock:
+            self._generations[model] = self._generations.get(model, 0) + 1
+
+    def reset(self):
+        """Forget all calls, e.g. those of threads lost in a fork."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+
+# Shared by every manager in the process.
+reads = SingleFlight()
@@ -0,0 +1,69 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from collections import OrderedDict
+
+
+class Transaction(object):
+    """Writes collected by OdooClient.transaction(), to send in one go.
+
+    Writes to the same record are merged, and records given the same
+    values share a single write call when committed.
+
+    Odoo commits each RPC on its own, so this can't make the writes
+    atomic on the server: if one call fails on commit, those before
+    it have already been made.
+    """
+
+    def __init__(self, client):
+        self.client = client
+        # {model: {id: vals}}, in the order they were first written.
+        self._writes = OrderedDict()
+        # {model: the manager that wrote to it}
+        self._managers = {}
+
+    def write(self, manager, ids, vals):
+        self._managers[manager.model] = manager
+        records = self._writes.setdefault(manager.model, OrderedDict())
+        for res_id in ids:
+            records.setdefault(res_id, {}).update(vals)
+
+    def pending_fields(self, model, ids):
+        """Names of the fields waiting to be written to any of 'ids'."""
+        records = self._writes.get(model, {})
+        fields = set()
+        for res_id in ids:
+            fields.update(records.get(res_id, ()))
+        return fields
+
+    def commit(self):
+        writes, self._writes = self._writes, OrderedDict()
+        for model, records in writes.items():
+            groups = []
+            for res_id, vals in records.items():
+                for group_vals, group_ids in groups:
+                    if group_vals == vals:
+                        group_ids.append(res_id)
+                        break
+                else:
+                    groups.append((vals, [res_id]))
+
+            manager = self._managers[model]
+            for vals, ids in groups:
+                manager.resource_env.write(ids, vals)
+                # Anything read since the write was queued is stale now.
+                manager.invalidate(ids)
+
+    def rollback(self):
+        self._writes = OrderedDict()
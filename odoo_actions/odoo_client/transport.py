@@ -0,0 +1,271 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""HTTP transports for odoorpc.
+
+odoorpc sends every request through a urllib opener, and by default that
+opens (and TLS handshakes) a new connection per call. The 'keepalive'
+transport keeps connections open between calls instead, resumes TLS
+sessions when it does have to reconnect, and can gzip bodies.
+
+Selected with the 'transport' option in the odoorpc settings block.
+"""
+
+import gzip
+import io
+import select
+import socket
+import ssl
+import threading
+import zlib
+
+try:
+    from http import client as http_client
+    from http.cookiejar import CookieJar
+    from urllib.error import URLError
+    from urllib.request import (
+        HTTPCookieProcessor, HTTPHandler, HTTPSHandler, build_opener)
+    from urllib.response import addinfourl
+except ImportError:
+    import httplib as http_client
+    from cookielib import CookieJar
+    from urllib2 import (
+        HTTPCookieProcessor, HTTPHandler, HTTPSHandler, URLError,
+        build_opener)
+    from urllib import addinfourl
+
+
+# Connections kept open per host. A pooled client is only used by one
+# thread at a time, so more than one is rarely needed.
+MAX_IDLE_CONNECTIONS = 2
+
+# SSLSession, and wrap_socket's 'session' argument, are Python 3.6+.
+CAN_RESUME_SESSIONS = hasattr(ssl, 'SSLSession')
+
+
+def _selector(req):
+    # Python 2 only has get_selector, and Python 3.4+ only selector.
+    selector = getattr(req, 'selector', None)
+    if selector is None:
+        selector = req.get_selector()
+    return selector
+
+
+def _is_dropped(connection):
+    """Whether the server has closed an idle kept-alive connection.
+
+    Nothing should arrive on a connection between requests, so if its
+    socket is readable the server has closed it (or sent something we
+    couldn't make sense of anyway).
+    """
+    if connection.sock is None:
+        return True
+    try:
+        readable, _, _ = select.select([connection.sock], [], [], 0)
+    except (select.error, ValueError):
+        return True
+    return bool(readable)
+
+
+class SessionResumingHTTPSConnection(http_client.HTTPSConnection):
+    """HTTPSConnection which resumes the last TLS session for its host.
+
+    Skips the full handshake when a kept-alive connection has been closed
+    by the server and we have to reconnect. Only on Python 3.6+; older
+    versions do a full handshake every time.
+    """
+
+    tls_sessions = None
+
+    def connect(self):
+        http_client.HTTPConnection.connect(self)
+        server_hostname = self._tunnel_host or self.host
+        kwargs = {'server_hostname': server_hostname}
+        session = self.tls_sessions.get(server_hostname)
+        if session is not None and CAN_RESUME_SESSIONS:
+            kwargs['session'] = session
+        self.sock = self._context.wrap_socket(self.sock, **kwargs)
+
+    def remember_session(self):
+        # Read after a response, as TLS 1.3 only sends the session ticket
+        # once the handshake is done.
+        session = getattr(self.sock, 'session', None)
+        if session is not None:
+            self.tls_sessions[self._tunnel_host or self.host] = session
+
+
+class KeepAliveHandlerMixin(object):
+    """Do the work of a urllib handler over persistent connections."""
+
+    def __init__(self, compress_requests=False, compress_responses=False,
+                 **kwargs):
+        super(KeepAliveHandlerMixin, self).__init__(**kwargs)
+        self.compress_requests = compress_requests
+        self.compress_responses = compress_responses
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _get_connection(self, http_class, host, timeout):
+        """An idle connection to 'host' the server hasn't closed, or a
+        new one."""
+        while True:
+            with self._lock:
+                idle = self._idle.get(host)
+                if not idle:
+                    break
+                connection = idle.pop()
+            if not _is_dropped(connection):
+                return connection
+            connection.close()
+        return self._new_connection(http_class, host, timeout)
+
+    def _new_connection(self, http_class, host, timeout):
+        return http_class(host, timeout=timeout)
+
+    def _put_connection(self, host, connection):
+        with self._lock:
+            idle = self._idle.setdefault(host, [])
+            if len(idle) < MAX_IDLE_CONNECTIONS:
+                idle.append(connection)
+                return
+        connection.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for connection in connections:
+                connection.close()
+
+    def _request(self, connection, req, body, headers):
+        connection.request(req.get_method(), _selector(req), body, headers)
+        return connection.getresponse()
+
+    def do_open(self, http_class, req, **kwargs):
+        host = req.host
+        if not host:
+            raise URLError('no host given')
+
+        headers = dict(req.unredirected_hdrs)
+        headers.update((k, v) for k, v in req.headers.items()
+                       if k not in headers)
+        headers = dict((name.title(), val) for name, val in headers.items())
+        headers['Connection'] = 'keep-alive'
+
+        body = req.data
+        if self.compress_responses:
+            headers['Accept-Encoding'] = 'gzip'
+        if self.compress_requests and body:
+            body = gzip_bytes(body)
+            headers['Content-Encoding'] = 'gzip'
+            headers['Content-Length'] = str(len(body))
+
+        # Idle connections the server has closed are dropped here,
+        # before anything is sent on them.
+        connection = self._get_connection(http_class, host, req.timeout)
+        try:
+            response = self._request(connection, req, body, headers)
+        except (socket.error, http_client.HTTPException) as e:
+            # Never sent again: once any of the request has gone out the
+            # server may have acted on it, even if the connection was
+            # then reset (timeouts included).
+            connection.close()
+            raise URLError(e)
+
+        # We have to read the whole body before the connection can be used
+        # for anything else.
+        try:
+            data = response.read()
+        except (socket.error, http_client.HTTPException) as e:
+            connection.close()
+            raise URLError(e)
+
+        if isinstance(connection, SessionResumingHTTPSConnection):
+            connection.remember_session()
+        if response.will_close:
+            connection.close()
+        else:
+            self._put_connection(host, connection)
+
+        if response.getheader('Content-Encoding') == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+        result = addinfourl(
+            io.BytesIO(data), response.msg, req.get_full_url(),
+            response.status)
+        result.msg = response.reason
+        return result
+
+
+class KeepAliveHTTPHandler(KeepAliveHandlerMixin, HTTPHandler):
+
+    def http_open(self, req):
+        return self.do_open(http_client.HTTPConnection, req)
+
+
+class KeepAliveHTTPSHandler(KeepAliveHandlerMixin, HTTPSHandler):
+
+    def __init__(self, context=None, **kwargs):
+        super(KeepAliveHTTPSHandler, self).__init__(**kwargs)
+        self.context = context or ssl.create_default_context()
+        self.tls_sessions = {}
+
+    def _new_connection(self, http_class, host, timeout):
+        connection = http_class(host, timeout=timeout, context=self.context)
+        connection.tls_sessions = self.tls_sessions
+        return connection
+
+    def https_open(self, req):
+        return self.do_open(SessionResumingHTTPSConnection, req)
+
+
+def gzip_bytes(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as gz:
+        gz.write(data)
+    return buf.getvalue()
+
+
+def build_keepalive_opener(odoo_conf):
+    kwargs = {
+        'compress_requests': bool(odoo_conf.get('compress_requests')),
+        'compress_responses': bool(odoo_conf.get('compress_responses')),
+    }
+    # Keep the cookie handling odoorpc's own opener has, as older Odoo
+    # versions hold the session in a cookie.
+    return build_opener(
+        HTTPCookieProcessor(CookieJar()),
+        KeepAliveHTTPHandler(**kwargs),
+        KeepAliveHTTPSHandler(**kwargs))
+
+
+TRANSPORTS = {
+    # odoorpc's own opener.
+    'default': lambda odoo_conf: None,
+    'keepalive': build_keepalive_opener,
+}
+
+
+def get_opener(odoo_conf):
+    """Build the urllib opener for the configured transport.
+
+    Returns None for the default transport, leaving odoorpc to use its
+    own opener.
+    """
+    transport = odoo_conf.get('transport') or 'default'
+    if transport not in TRANSPORTS:
+        raise ValueError(
+            "Unknown odoorpc transport '%s', expected one of: %s"
+            % (transport, ", ".join(sorted(TRANSPORTS))))
+    return TRANSPORTS[transport](odoo_conf)
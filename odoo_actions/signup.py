@@ -25,6 +25,7 @@ from adjutant.common import user_store
 
 from odoo_actions import odoo_client
 from odoo_actions.odoo_client import DEFAULT_PHYSICAL_ADDRESS_CONTACT_NAME
+from odoo_actions.odoo_client.common import BulkCreateError
 from odoo_actions.utils import generate_short_id
 
 
@@ -201,15 +202,36 @@ class NewClientSignUpAction(BaseAction):
             name=self.company_name, is_company=True)
 
         if len(customers) > 0:
+            # Look up every similar company, and their contacts, at once.
+            companies = dict(
+                (company.id, company) for company in
+                odooclient.partners.get(
+                    [customer['id'] for customer in customers]))
+            queries = []
+            for customer in customers:
+                queries.append({
+                    'name': self.name, 'check_parent': True,
+                    'parent': customer['id']})
+                if not self.primary_contact_is_billing:
+                    queries.append({
+                        'name': self.bill_name, 'check_parent': True,
+                        'parent': customer['id']})
+            contacts = iter(odooclient.partners.fuzzy_match_many(queries))
+
             for customer in customers:
                 if customer['match'] == 1:
                     self.add_note(
                         "Exact company exists: %s" % customer['name'])
-                    self._validate_similar_organisation(customer)
                 else:
                     self.add_note(
                         "Similar company exists: %s" % customer['name'])
-                    self._validate_similar_organisation(customer)
+                primary_contacts = next(contacts)
+                billing_contacts = []
+                if not self.primary_contact_is_billing:
+                    billing_contacts = next(contacts)
+                self._validate_similar_organisation(
+                    customer, companies.get(customer['id']),
+                    primary_contacts, billing_contacts)
 
             # We set the name to something obvious in odoo
             self.odoo_company_name = (
@@ -227,24 +249,18 @@ class NewClientSignUpAction(BaseAction):
             self.odoo_company_name = self.company_name
             return True
 
-    def _validate_similar_organisation(self, customer):
-        odooclient = odoo_client.get_odoo_client()
-
-        company = odooclient.partners.get(customer['id'])[0]
-
-        tags = [tag.id for tag in company.category_id]
-        if self.cloud_tag_id and self.cloud_tag_id in tags:
-            self.add_note(
-                "Company: %s has cloud tag." % customer['name'])
-        elif self.cloud_tag_id:
-            self.add_note(
-                "Company: %s does not have cloud tag." % customer['name'])
-
-        contacts = odooclient.partners.fuzzy_match(
-            name=self.name, check_parent=True,
-            parent=customer['id'])
+    def _validate_similar_organisation(self, customer, company,
+                                       primary_contacts, billing_contacts):
+        if company is not None:
+            tags = [tag.id for tag in company.category_id]
+            if self.cloud_tag_id and self.cloud_tag_id in tags:
+                self.add_note(
+                    "Company: %s has cloud tag." % customer['name'])
+            elif self.cloud_tag_id:
+                self.add_note(
+                    "Company: %s does not have cloud tag." % customer['name'])
 
-        for contact in contacts:
+        for contact in primary_contacts:
             if contact['match'] == 1:
                 self.add_note(
                     "Primary contact: %s found for company: %s" %
@@ -254,20 +270,15 @@ class NewClientSignUpAction(BaseAction):
                     "Similar primary contact: %s found for company: %s" %
                     (contact['name'], customer['name']))
 
-        if not self.primary_contact_is_billing:
-            contacts = odooclient.partners.fuzzy_match(
-                name=self.bill_name, check_parent=True,
-                parent=customer['id'])
-
-            for contact in contacts:
-                if contact['match'] == 1:
-                    self.add_note(
-                        "Billing contact: %s found for company: %s" %
-                        (contact['name'], customer['name']))
-                else:
-                    self.add_note(
-                        "Similar billing contact: %s found for company: %s" %
-                        (contact['name'], customer['name']))
+        for contact in billing_contacts:
+            if contact['match'] == 1:
+                self.add_note(
+                    "Billing contact: %s found for company: %s" %
+                    (contact['name'], customer['name']))
+            else:
+                self.add_note(
+                    "Similar billing contact: %s found for company: %s" %
+                    (contact['name'], customer['name']))
 
     def _validate_individual(self):
         odooclient = odoo_client.get_odoo_client()
@@ -405,7 +416,7 @@ class NewClientSignUpAction(BaseAction):
                     partner_dict['category_id'] = \
                         [(6, 0, [self.cloud_tag_id])]
                 if self.set_fiscal_position:
-                    partner_dict['property_account_position'] = \
+                    partner_dict[odooclient.partners.fiscal_position_field] = \
                         self.fiscal_position_id
                 partner_id = odooclient.partners.create(**partner_dict)
             except Exception as e:
@@ -416,71 +427,105 @@ class NewClientSignUpAction(BaseAction):
             self.add_note("Partner '%s' created." % self.odoo_company_name)
         self.action.task.cache['partner_id'] = partner_id
 
+        # The contacts all belong to the company, so whichever of them
+        # still need creating can be created together.
+        contacts = []
+
         if not self.primary_address_is_billing:
-            physical_address_id = self.get_cache('physical_address_id')
-            if physical_address_id:
+            if self.get_cache('physical_address_id'):
                 self.add_note("Physical address contact already created.")
             else:
-                try:
-                    physical_address_id = odooclient.partners.create(
-                        is_company=False,
-                        opt_out=True,
-                        name=self.physical_address_contact_name,
-                        street=self.address_1,
-                        street2=self.address_2,
-                        city=self.city, zip=self.postal_code,
-                        country_id=self.country_id,
-                        parent_id=partner_id)
-                except Exception as e:
-                    self.add_note(
-                        "Error: '%s' while setting up "
-                        "physical address contact in Odoo." % e)
-                    raise
-                self.set_cache('physical_address_id', physical_address_id)
-                self.add_note("Physical address contact '%s' created." %
-                              self.physical_address_contact_name)
-            self.action.task.cache['physical_address_id'] = physical_address_id
+                contacts.append((
+                    'physical_address_id', "physical address contact",
+                    self.physical_address_contact_name, {
+                        'is_company': False,
+                        'opt_out': True,
+                        'name': self.physical_address_contact_name,
+                        'street': self.address_1,
+                        'street2': self.address_2,
+                        'city': self.city,
+                        'zip': self.postal_code,
+                        'country_id': self.country_id,
+                        'parent_id': partner_id,
+                    }))
 
         # Now we handle the primary contact for the new project:
-        primary_id = self.get_cache('primary_id')
-        if primary_id:
+        if self.get_cache('primary_id'):
             self.add_note("Primary contact already created.")
         else:
-            try:
-                primary_id = odooclient.partners.create(
-                    is_company=False, opt_out=(not self.news_agreed),
-                    name=self.name,
-                    email=self.email, phone=self.phone,
-                    parent_id=partner_id,
-                    use_parent_address=True)
-            except Exception as e:
-                self.add_note(
-                    "Error: '%s' while setting up "
-                    "primary contact in Odoo." % e)
-                raise
-            self.set_cache('primary_id', primary_id)
-            self.add_note("Primary contact '%s' created." % self.name)
+            contacts.append((
+                'primary_id', "primary contact", self.name, {
+                    'is_company': False,
+                    'opt_out': not self.news_agreed,
+                    'name': self.name,
+                    'email': self.email,
+                    'phone': self.phone,
+                    'parent_id': partner_id,
+                    'use_parent_address': True,
+                }))
+
+        if self.get_cache('billing_id'):
+            self.add_note("Billing contact already created.")
+        elif not self.primary_contact_is_billing:
+            contacts.append((
+                'billing_id', "billing contact", self.bill_name, {
+                    'is_company': False,
+                    'opt_out': True,
+                    'name': self.bill_name,
+                    'email': self.bill_email,
+                    'parent_id': partner_id,
+                }))
+
+        self._create_contacts(contacts)
+
+        if not self.primary_address_is_billing:
+            self.action.task.cache['physical_address_id'] = self.get_cache(
+                'physical_address_id')
+
+        primary_id = self.get_cache('primary_id')
         self.action.task.cache['primary_id'] = primary_id
 
         billing_id = self.get_cache('billing_id')
-        if billing_id:
-            self.add_note("Billing contact already created.")
-        elif self.primary_contact_is_billing:
+        if not billing_id and self.primary_contact_is_billing:
             billing_id = primary_id
-        elif not self.primary_contact_is_billing:
-            try:
-                billing_id = odooclient.partners.create(
-                    is_company=False, opt_out=True, name=self.bill_name,
-                    email=self.bill_email, parent_id=partner_id)
-            except Exception as e:
-                self.add_note(
-                    "Error: '%s' while setting up "
-                    "billing contact in Odoo." % e)
-                raise
-            self.set_cache('billing_id', billing_id)
-            self.add_note("Billing contact '%s' created." % self.bill_name)
         self.action.task.cache['billing_id'] = billing_id
 
+    def _create_contacts(self, contacts):
+        """Create company contacts in a single batch.
+
+        'contacts' is a list of (cache_key, label, name, fields). Each
+        created id is cached under its key, so if some fail a retry
+        will only create those still missing.
+        """
+        if not contacts:
+            return
+
+        odooclient = odoo_client.get_odoo_client()
+        try:
+            contact_ids = odooclient.partners.create_many(
+                [fields for _, _, _, fields in contacts])
+            failure = None
+        except BulkCreateError as e:
+            contact_ids = e.ids
+            failure = e
+        except Exception as e:
+            self.add_note(
+                "Error: '%s' while setting up %s in Odoo." %
+                (e, ", ".join(label for _, label, _, _ in contacts)))
+            raise
+
+        for index, (cache_key, label, name, _) in enumerate(contacts):
+            if contact_ids[index]:
+                self.set_cache(cache_key, contact_ids[index])
+                self.add_note("%s '%s' created." % (label.capitalize(), name))
+            else:
+                self.add_note(
+                    "Error: '%s' while setting up %s in Odoo." %
+                    (failure.errors[index], label))
+
+        if failure:
+            raise failure
+
     def _create_individual(self):
         odooclient = odoo_client.get_odoo_client()
 
@@ -511,7 +556,7 @@ class NewClientSignUpAction(BaseAction):
                     partner_dict['category_id'] = [(6, 0, tags)]
 
                 if self.set_fiscal_position:
-                    partner_dict['property_account_position'] = \
+                    partner_dict[odooclient.partners.fiscal_position_field] = \
                         self.fiscal_position_id
                 partner_id = odooclient.partners.create(**partner_dict)
             except Exception as e:
@@ -694,67 +739,62 @@ class NewProjectSignUpAction(NewProjectWithUserAction):
 
     def _link_organisation_contacts(self):
         partner_id = self.action.task.cache.get('partner_id')
-        odoo_project_id = self.get_cache('odoo_project_id')
-        odooclient = odoo_client.get_odoo_client()
-
-        owner_rel = self.get_cache('owner_rel')
-        if not owner_rel:
-            owner_rel = odooclient.project_relationships.create(
-                cloud_tenant=odoo_project_id,
-                partner_id=partner_id,
-                contact_type="owner")
-            self.set_cache('owner_rel', owner_rel)
-
         primary_id = self.action.task.cache.get('primary_id')
-
-        primary_rel = self.get_cache('primary_rel')
-        if not primary_rel:
-            primary_rel = odooclient.project_relationships.create(
-                cloud_tenant=odoo_project_id,
-                partner_id=primary_id,
-                contact_type="primary")
-            self.set_cache('primary_rel', primary_rel)
-
         billing_id = self.action.task.cache.get('billing_id')
 
-        billing_rel = self.get_cache('billing_rel')
-        if billing_id and not billing_rel:
-            billing_rel = odooclient.project_relationships.create(
-                cloud_tenant=odoo_project_id,
-                partner_id=billing_id,
-                contact_type="billing")
-            self.set_cache('billing_rel', billing_rel)
+        relationships = [
+            ('owner_rel', partner_id, "owner"),
+            ('primary_rel', primary_id, "primary"),
+        ]
+        if billing_id:
+            relationships.append(('billing_rel', billing_id, "billing"))
+        self._create_relationships(relationships)
 
     def _link_individual(self):
         partner_id = self.action.task.cache.get('partner_id')
-        odoo_project_id = self.get_cache('odoo_project_id')
-        odooclient = odoo_client.get_odoo_client()
+        primary_id = self.action.task.cache.get('primary_id')
 
-        owner_rel = self.get_cache('owner_rel')
-        if not owner_rel:
-            owner_rel = odooclient.project_relationships.create(
-                cloud_tenant=odoo_project_id,
-                partner_id=partner_id,
-                contact_type="owner")
-            self.set_cache('owner_rel', owner_rel)
+        relationships = [
+            ('owner_rel', partner_id, "owner"),
+            ('primary_rel', primary_id, "primary"),
+        ]
+        if primary_id:
+            relationships.append(('billing_rel', primary_id, "billing"))
+        self._create_relationships(relationships)
 
-        primary_id = self.action.task.cache.get('primary_id')
+    def _create_relationships(self, relationships):
+        """Link partners to the odoo project in a single batch.
 
-        primary_rel = self.get_cache('primary_rel')
-        if not primary_rel:
-            primary_rel = odooclient.project_relationships.create(
-                cloud_tenant=odoo_project_id,
-                partner_id=primary_id,
-                contact_type="primary")
-            self.set_cache('primary_rel', primary_rel)
+        'relationships' is a list of (cache_key, partner_id, contact_type).
+        Those already cached are skipped, and each one created is cached
+        so if some fail a retry will only create those still missing.
+        """
+        odoo_project_id = self.get_cache('odoo_project_id')
+        relationships = [
+            (cache_key, partner_id, contact_type)
+            for cache_key, partner_id, contact_type in relationships
+            if not self.get_cache(cache_key)]
+        if not relationships:
+            return
 
-        billing_rel = self.get_cache('billing_rel')
-        if primary_id and not billing_rel:
-            billing_rel = odooclient.project_relationships.create(
-                cloud_tenant=odoo_project_id,
-                partner_id=primary_id,
-                contact_type="billing")
-            self.set_cache('billing_rel', billing_rel)
+        odooclient = odoo_client.get_odoo_client()
+        try:
+            rel_ids = odooclient.project_relationships.create_many([{
+                'cloud_tenant': odoo_project_id,
+                'partner_id': partner_id,
+                'contact_type': contact_type,
+            } for _, partner_id, contact_type in relationships])
+            failure = None
+        except BulkCreateError as e:
+            rel_ids = e.ids
+            failure = e
+
+        for (cache_key, _, _), rel_id in zip(relationships, rel_ids):
+            if rel_id:
+                self.set_cache(cache_key, rel_id)
+
+        if failure:
+            raise failure
 
     def _create_initial_credit(self):
         # floating point dollar amount
@@ -1,6 +1,9 @@
 import six
 from mock import MagicMock
 from collections import Iterable
+from contextlib import contextmanager
+
+from odoo_actions.odoo_client.common import BulkCreateError
 
 odoo_cache = {}
 base_id = 20  # NOTE(amelia): Set at twenty to avoid conflicts with any setup
@@ -77,6 +80,14 @@ class FakeOdooResourceManager(object):
 
     defaults = {}
 
+    # Which cache the records of each many2one field are in.
+    related_resources = {
+        'partner_id': 'partners',
+        'parent_id': 'partners',
+        'country_id': 'countries',
+        'cloud_tenant': 'projects',
+    }
+
     def __init__(self, resource):
         self.resource = resource
 
@@ -88,18 +99,45 @@ class FakeOdooResourceManager(object):
             ids = [ids, ]
         return ids
 
-    def get(self, ids, read=False):
+    def get(self, ids, read=False, fields=None, include=None):
         resources = []
         for res_id in self._is_iterable(ids):
             res = self.odoo_cache[self.resource].get(res_id)
             if res:
-                if read:
+                if read or include:
                     resources.append(res)
                 else:
                     resources.append(OdooObject(res))
+        if include:
+            return self._include(resources, include)
+        return resources
+
+    def _include(self, resources, include):
+        nested = {}
+        for path in include:
+            name, _, rest = path.partition('.')
+            nested.setdefault(name, [])
+            if rest:
+                nested[name].append(rest)
+
+        resources = [dict(res) for res in resources]
+        for name, sub_include in nested.items():
+            manager = FakeOdooResourceManager(self.related_resources[name])
+            for res in resources:
+                value = res.get(name)
+                if isinstance(value, OdooObject):
+                    value = value.id
+                elif isinstance(value, (list, tuple)):
+                    value = value[0]
+                related = []
+                if value:
+                    related = manager.get(
+                        value, read=True, include=sub_include or None)
+                res[name] = related[0] if related else False
         return resources
 
-    def list(self, filters, read=False):
+    def list(self, filters, get=True, read=False, fields=None,
+             limit=None, offset=0, order=None, include=None):
         """
         For the purposes of this mocking... we will assume that the '|'
         operator is not used, just the implicit AND.
@@ -125,12 +163,30 @@ class FakeOdooResourceManager(object):
                         match = False
                         break
             if match:
-                if read:
+                if not get:
+                    resources.append(resource['id'])
+                elif read or include:
                     resources.append(resource)
                 else:
                     resources.append(OdooObject(resource))
+        if limit:
+            resources = resources[offset:offset + limit]
+        else:
+            resources = resources[offset:]
+        if include and get:
+            return self._include(resources, include)
         return resources
 
+    def count(self, filters):
+        return len(self.list(filters, get=False))
+
+    def exists(self, filters):
+        return bool(self.list(filters, get=False, limit=1))
+
+    def exists_ids(self, ids):
+        return [res_id for res_id in self._is_iterable(ids)
+                if res_id in self.odoo_cache[self.resource]]
+
     def create(self, **fields):
         res_id = _get_new_id()
         fields['id'] = res_id
@@ -143,6 +199,29 @@ class FakeOdooResourceManager(object):
         self.odoo_cache[self.resource][res_id] = fields
         return res_id
 
+    def create_many(self, vals_list):
+        # Like the real one once it falls back to creating one at a time.
+        ids = []
+        errors = {}
+        for index, vals in enumerate(vals_list):
+            try:
+                ids.append(self.create(**vals))
+            except Exception as e:
+                ids.append(None)
+                errors[index] = e
+        if errors:
+            raise BulkCreateError(ids, errors)
+        return ids
+
+    def write(self, ids, vals, only_changed=True, current=None):
+        for res_id in self._is_iterable(ids):
+            resource = self.odoo_cache[self.resource][res_id]
+            for key, value in vals.items():
+                if key == 'country_id' and isinstance(value, int):
+                    value = OdooObject(self.odoo_cache['countries'][value])
+                resource[key] = value
+        return vals
+
     def delete(self, res_ids):
         res_ids = self._is_iterable(res_ids)
         for res_id in res_ids:
@@ -157,8 +236,10 @@ class FakePartnerManager(FakeOdooResourceManager):
         'category_id': [],
     }
 
+    fiscal_position_field = 'property_account_position'
+
     def fuzzy_match(self, name, is_company=False, check_parent=False,
-                    parent=None):
+                    parent=None, threshold=0.8):
 
         search = [
             ('is_company', '=', is_company),
@@ -184,6 +265,9 @@ class FakePartnerManager(FakeOdooResourceManager):
 
         return matches
 
+    def fuzzy_match_many(self, queries):
+        return [self.fuzzy_match(**query) for query in queries]
+
     def add_internal_note(self, partner_id, body, **kwargs):
         partner = self.odoo_cache[self.resource][partner_id]
         message = {'body': body}
@@ -196,7 +280,7 @@ class FakePartnerManager(FakeOdooResourceManager):
 
 class FakeCountryManager(FakeOdooResourceManager):
 
-    def fuzzy_match(self, code):
+    def fuzzy_match(self, code, threshold=0.8):
         search = [
             ('code', '=', code)
         ]
@@ -226,6 +310,12 @@ class FakeOdooClient(object):
         self.tags = FakeOdooResourceManager("tags")
         self.stripe_partners = FakeOdooResourceManager("stripe_partners")
         self._odoorpc = MagicMock()
+        self.current_transaction = None
+
+    @contextmanager
+    def transaction(self):
+        # Writes to the fake cache are immediate.
+        yield
 
 
 def setup_odoo_cache():
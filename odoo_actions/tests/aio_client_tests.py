@@ -0,0 +1,160 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import asyncio
+
+from django.test import SimpleTestCase
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from odoorpc.error import RPCError
+
+from odoo_actions.odoo_client.aio import AsyncOdooClient
+
+
+class FakeOdooServer(object):
+    """Stand-in for Odoo's /jsonrpc endpoint, backed by dicts."""
+
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        # Returned for every call, if set.
+        self.error = None
+
+    async def handle(self, request):
+        body = await request.json()
+        if self.error:
+            return web.json_response({'id': body['id'], 'error': self.error})
+        params = body['params']
+        self.calls.append((params['service'], params['method']))
+
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Give concurrent calls the chance to overlap.
+            await asyncio.sleep(0.01)
+            result = self.dispatch(params['service'], params['method'],
+                                   params['args'])
+        except KeyError as e:
+            return web.json_response({'id': body['id'], 'error': {
+                'code': 200, 'data': {'message': "No such model %s" % e}}})
+        finally:
+            self.in_flight -= 1
+        return web.json_response({'id': body['id'], 'result': result})
+
+    def dispatch(self, service, method, args):
+        if service == 'common':
+            return 1 if args[1:] == ['user', 'pass'] else False
+
+        db, uid, password, model, model_method, args, kwargs = args
+        records = self.records[model]
+        if model_method == 'search':
+            return sorted(
+                rec_id for rec_id, rec in records.items()
+                if all(rec.get(key) == value for key, _, value in args[0]))
+        if model_method == 'read':
+            return [dict(records[rec_id], id=rec_id) for rec_id in args[0]]
+        if model_method == 'create':
+            rec_id = max(records or [0]) + 1
+            records[rec_id] = args[0]
+            return rec_id
+
+
+class AsyncOdooClientTests(SimpleTestCase):
+
+    def setUp(self):
+        self.odoo = FakeOdooServer({
+            'cloud.tenant': {1: {'name': 'project', 'tenant_id': 'abc'}},
+            'res.partner': {2: {'name': 'Cloud Company'}},
+            'res.country': {3: {'name': 'New Zealand', 'code': 'NZ'}},
+        })
+
+    def _run(self, test, password='pass'):
+        async def run():
+            app = web.Application()
+            app.router.add_post('/jsonrpc', self.odoo.handle)
+            server = TestServer(app)
+            await server.start_server()
+            conf = {'odoorpc': {
+                'hostname': server.host, 'port': server.port,
+                'protocol': 'jsonrpc', 'database': 'db',
+                'user': 'user', 'password': password}}
+            try:
+                async with AsyncOdooClient(conf) as odooclient:
+                    return await test(odooclient)
+            finally:
+                await server.close()
+        return asyncio.run(run())
+
+    def test_list_and_get(self):
+        async def test(odooclient):
+            return await odooclient.projects.list(
+                [('tenant_id', '=', 'abc')])
+
+        projects = self._run(test)
+
+        self.assertEqual(projects[0]['name'], 'project')
+        self.assertEqual(
+            self.odoo.calls,
+            [('common', 'login'), ('object', 'execute_kw'),
+             ('object', 'execute_kw')])
+
+    def test_concurrent_lookups(self):
+        async def test(odooclient):
+            return await asyncio.gather(
+                odooclient.projects.get(1),
+                odooclient.partners.get(2),
+                odooclient.countries.get(3))
+
+        project, partner, country = self._run(test)
+
+        self.assertEqual(partner[0]['name'], 'Cloud Company')
+        self.assertEqual(country[0]['code'], 'NZ')
+        self.assertGreater(self.odoo.max_in_flight, 1)
+        # Concurrent first calls still only log in once.
+        self.assertEqual(self.odoo.calls.count(('common', 'login')), 1)
+
+    def test_create(self):
+        async def test(odooclient):
+            return await odooclient.partners.create(name='New Partner')
+
+        partner_id = self._run(test)
+
+        self.assertEqual(
+            self.odoo.records['res.partner'][partner_id],
+            {'name': 'New Partner'})
+
+    def test_rpc_error(self):
+        async def test(odooclient):
+            return await odooclient.credits.get(1)
+
+        self.assertRaises(RPCError, self._run, test)
+
+    def test_rpc_error_without_data(self):
+        self.odoo.error = {'code': -32600, 'message': 'Invalid request'}
+
+        async def test(odooclient):
+            return await odooclient.projects.get(1)
+
+        with self.assertRaises(RPCError) as cm:
+            self._run(test)
+        self.assertEqual(str(cm.exception), 'Invalid request')
+
+    def test_bad_login(self):
+        async def test(odooclient):
+            return await odooclient.projects.get(1)
+
+        self.assertRaises(RPCError, self._run, test, password='wrong')
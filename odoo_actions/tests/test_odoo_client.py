@@ -0,0 +1,1621 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import gc
+import gzip
+import io
+import json
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+from django.test import SimpleTestCase
+from django.test.utils import override_settings
+
+import mock
+import odoorpc
+
+from odoo_actions import odoo_client
+from odoo_actions.odoo_client.client import OdooClient, ReconnectingODOO
+from odoo_actions.odoo_client import identity_map
+from odoo_actions.odoo_client.browse import browse_fields
+from odoo_actions.odoo_client.cache import LocalCache
+from odoo_actions.odoo_client.common import BulkCreateError
+from odoo_actions.odoo_client.countries import CountryManager
+from odoo_actions.odoo_client.country_index import CountryIndex
+from odoo_actions.odoo_client.ngrams import NgramIndex
+from odoo_actions.odoo_client import partner_sync
+from odoo_actions.odoo_client.partner_index import PartnerIndex
+from odoo_actions.odoo_client.partner_sync import PartnerSync
+from odoo_actions.odoo_client.partners import PartnerManager
+from odoo_actions.odoo_client.pool import ClientPool, PoolTimeout
+from odoo_actions.odoo_client.schema import PayloadError, SchemaStore
+from odoo_actions.odoo_client.singleflight import SingleFlight
+from odoo_actions.odoo_client.transport import get_opener, gzip_bytes
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.error import URLError
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from urllib2 import URLError
+    from SocketServer import ThreadingMixIn
+
+
+class ClientPoolTests(SimpleTestCase):
+
+    def test_checkout_reuses_checked_in_client(self):
+        pool = ClientPool(object, size=2)
+
+        client = pool.checkout()
+        pool.checkin(client)
+
+        self.assertIs(pool.checkout(), client)
+        self.assertEqual(pool.in_use, 1)
+
+    def test_checkout_times_out_when_exhausted(self):
+        pool = ClientPool(object, size=1, timeout=0.01)
+        pool.checkout()
+
+        self.assertRaises(PoolTimeout, pool.checkout)
+
+    def test_checkout_waits_for_checkin(self):
+        pool = ClientPool(object, size=1, timeout=5)
+        client = pool.checkout()
+
+        timer = threading.Timer(0.05, pool.checkin, [client])
+        timer.start()
+
+        self.assertIs(pool.checkout(), client)
+        timer.join()
+
+    def test_check_idle_pings_idle_clients(self):
+        pool = ClientPool(mock.Mock, size=2)
+        busy = pool.checkout()
+        idle = pool.checkout()
+        pool.checkin(idle)
+
+        pool.check_idle()
+
+        idle.ping.assert_called_once_with()
+        busy.ping.assert_not_called()
+        self.assertEqual(pool.idle, 1)
+
+    def test_failed_build_frees_slot(self):
+        factory = mock.Mock(side_effect=[ValueError("no login"), "client"])
+        pool = ClientPool(factory, size=1, timeout=0.01)
+
+        self.assertRaises(ValueError, pool.checkout)
+        self.assertEqual(pool.checkout(), "client")
+
+
+@mock.patch.object(odoo_client, 'client_pool', None)
+@mock.patch.object(odoo_client, 'HealthChecker', mock.Mock())
+@mock.patch.object(
+    odoo_client.country_index, 'CountryIndexRefresher', mock.Mock())
+@mock.patch.object(odoo_client.partner_sync, 'PartnerSyncer', mock.Mock())
+@mock.patch.object(odoo_client, 'OdooClient', lambda conf: mock.Mock())
+class GetOdooClientTests(SimpleTestCase):
+
+    def tearDown(self):
+        odoo_client.release_odoo_client()
+
+    def test_client_held_per_thread(self):
+        client = odoo_client.get_odoo_client()
+        self.assertIs(odoo_client.get_odoo_client(), client)
+
+        other = []
+        thread = threading.Thread(
+            target=lambda: other.append(odoo_client.get_odoo_client()))
+        thread.start()
+        thread.join()
+
+        self.assertIsNot(other[0], client)
+
+    def test_release_returns_client_to_pool(self):
+        client = odoo_client.get_odoo_client()
+        odoo_client.release_odoo_client()
+
+        pool = odoo_client.get_client_pool()
+        self.assertEqual(pool.idle, 1)
+        self.assertIs(odoo_client.get_odoo_client(), client)
+
+    def test_lease_outside_request(self):
+        with odoo_client.odoo_client_lease() as client:
+            self.assertIs(odoo_client.get_odoo_client(), client)
+            with odoo_client.odoo_client_lease() as nested:
+                self.assertIs(nested, client)
+            # The outer lease still holds it.
+            self.assertEqual(odoo_client.get_client_pool().idle, 0)
+
+        self.assertEqual(odoo_client.get_client_pool().idle, 1)
+
+    def test_client_of_dead_thread_reclaimed(self):
+        thread = threading.Thread(target=odoo_client.get_odoo_client)
+        thread.start()
+        thread.join()
+        del thread
+
+        # A thread's locals can be freed a little after join returns
+        # (e.g. on Python 2), so wait a while for them.
+        pool = odoo_client.get_client_pool()
+        deadline = time.time() + 5
+        while pool.idle != 1 and time.time() < deadline:
+            gc.collect()
+            time.sleep(0.01)
+        self.assertEqual(pool.idle, 1)
+        self.assertEqual(pool.in_use, 0)
+
+    def test_partner_index_opt_in(self):
+        with mock.patch.object(
+                odoo_client.partner_sync, 'PartnerSyncer') as syncer:
+            odoo_client.get_client_pool()
+            syncer.assert_not_called()
+
+            odoo_client.client_pool = None
+            with override_settings(PLUGIN_SETTINGS={'adjutant-odoo': {
+                    'odoo_client': {'partner_index': True,
+                                    'partner_sync_interval': None}}}):
+                odoo_client.get_client_pool()
+            syncer.assert_not_called()
+
+            odoo_client.client_pool = None
+            with override_settings(PLUGIN_SETTINGS={'adjutant-odoo': {
+                    'odoo_client': {'partner_index': True}}}):
+                pool = odoo_client.get_client_pool()
+            syncer.assert_called_once_with(
+                pool, partner_sync.DEFAULT_SYNC_INTERVAL)
+            syncer.return_value.start.assert_called_once_with()
+
+    def test_new_pool_after_fork(self):
+        client = odoo_client.get_odoo_client()
+        pool = odoo_client.get_client_pool()
+
+        with mock.patch.object(odoo_client, '_pool_pid', -1):
+            self.assertIsNot(odoo_client.get_odoo_client(), client)
+            self.assertIsNot(odoo_client.get_client_pool(), pool)
+
+    @override_settings(PLUGIN_SETTINGS={'adjutant-odoo': {
+        'odoo_client': {'warm_after_fork': True}}})
+    def test_post_fork_warms_client(self):
+        odoo_client.post_fork()
+
+        pool = odoo_client.get_client_pool()
+        self.assertEqual(pool.idle, 1)
+        pool.checkout().connect.assert_called_once_with()
+
+
+@mock.patch('odoo_actions.odoo_client.schema._stores', {})
+@mock.patch('odoo_actions.odoo_client.client.ReconnectingODOO')
+class OdooClientTests(SimpleTestCase):
+
+    conf = {'odoorpc': {
+        'hostname': 'odoo.example.com', 'protocol': 'jsonrpc+ssl',
+        'port': 443, 'version': '8.0', 'database': 'db',
+        'user': 'user', 'password': 'pass'}}
+
+    def test_login_deferred_until_first_use(self, mock_odoo):
+        client = OdooClient(self.conf)
+        mock_odoo.assert_not_called()
+
+        client.partners.list([('name', '=', 'bob')], get=False)
+
+        mock_odoo.return_value.login.assert_called_once_with(
+            'db', 'user', 'pass')
+        mock_odoo.return_value.env.__getitem__.assert_called_once_with(
+            'res.partner')
+
+    def test_model_resolved_once(self, mock_odoo):
+        client = OdooClient(self.conf)
+
+        client.partners.resource_env
+        client.partners.resource_env
+        client._Partner
+
+        self.assertEqual(
+            mock_odoo.return_value.env.__getitem__.call_count, 1)
+
+    @mock.patch('odoo_actions.odoo_client.cache._caches', {})
+    def test_read_cache_shared_between_clients(self, mock_odoo):
+        conf = dict(self.conf, read_cache={'countries': {'ttl': 60}})
+
+        first = OdooClient(conf)
+        second = OdooClient(conf)
+
+        self.assertIsInstance(first.countries.cache, LocalCache)
+        self.assertIs(first.countries.cache, second.countries.cache)
+        self.assertIsNone(first.partners.cache)
+
+    def test_read_cache_unknown_manager(self, mock_odoo):
+        conf = dict(self.conf, read_cache={'planets': {}})
+
+        self.assertRaises(ValueError, OdooClient, conf)
+
+    def test_payload_checked_against_schema(self, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        client = OdooClient(self.conf)
+        env = mock_odoo.return_value.env.__getitem__.return_value
+
+        with self.assertRaises(PayloadError) as cm:
+            client.partners.create(name=1, city='Wellington')
+
+        self.assertEqual(cm.exception.errors, {
+            'name': "expected char, got int",
+        })
+        env.create.assert_not_called()
+        self.assertEqual(client.partners.fiscal_position_field,
+                         'property_account_position_id')
+
+    @mock.patch('odoo_actions.odoo_client.schema.LOG')
+    def test_payload_unknown_fields_left_out(self, mock_log, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        client = OdooClient(self.conf)
+        env = mock_odoo.return_value.env.__getitem__.return_value
+
+        client.partners.create(
+            name='bob', property_account_position=2, opt_out=True)
+
+        env.create.assert_called_once_with({'name': 'bob'})
+        mock_log.warning.assert_any_call(
+            "res.partner has no field 'property_account_position', leaving "
+            "it out (did you mean 'property_account_position_id'?).")
+        mock_log.warning.assert_any_call(
+            "res.partner has no field 'opt_out', leaving it out.")
+
+    def test_schema_fetched_once(self, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        mock_odoo.return_value.env.registry = {}
+
+        OdooClient(self.conf).partners.resource_env
+        OdooClient(self.conf).partners.resource_env
+
+        mock_odoo.return_value.execute.assert_called_once_with(
+            'res.partner', 'fields_get')
+        model = mock_odoo.return_value.env.registry['res.partner']
+        self.assertIn('property_account_position_id', model._columns)
+
+    def test_ping_resets_dead_connection(self, mock_odoo):
+        client = OdooClient(self.conf)
+        client.partners.resource_env
+        mock_odoo.return_value.execute.side_effect = IOError("gone")
+
+        self.assertFalse(client.ping())
+        self.assertIsNone(client._connection)
+        self.assertEqual(client._models, {})
+
+    partner_fields = {
+        'name': {'type': 'char'},
+        'city': {'type': 'char'},
+        'property_account_position_id': {
+            'type': 'many2one', 'relation': 'account.fiscal.position'},
+    }
+
+    def test_transaction_batches_writes(self, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        client = OdooClient(self.conf)
+        env = mock_odoo.return_value.env.__getitem__.return_value
+
+        with client.transaction():
+            client.partners.write(1, {'name': 'bob'}, only_changed=False)
+            client.partners.write(1, {'city': 'Wellington'},
+                                  only_changed=False)
+            client.partners.write(2, {'name': 'bob', 'city': 'Wellington'},
+                                  only_changed=False)
+            env.write.assert_not_called()
+
+        env.write.assert_called_once_with(
+            [1, 2], {'name': 'bob', 'city': 'Wellington'})
+
+    def test_transaction_rolled_back_on_error(self, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        client = OdooClient(self.conf)
+        env = mock_odoo.return_value.env.__getitem__.return_value
+
+        with self.assertRaises(ValueError):
+            with client.transaction():
+                client.partners.write(1, {'name': 'bob'}, only_changed=False)
+                raise ValueError()
+
+        env.write.assert_not_called()
+        self.assertIsNone(client.current_transaction)
+
+    def test_transaction_pending_fields_always_written(self, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        client = OdooClient(self.conf)
+        env = mock_odoo.return_value.env.__getitem__.return_value
+
+        with client.transaction():
+            client.partners.write(1, {'name': 'alice'}, only_changed=False)
+            # Matches the server, but not what is about to be written.
+            client.partners.write(1, {'name': 'bob'},
+                                  current={'id': 1, 'name': 'bob'})
+
+        env.write.assert_called_once_with([1], {'name': 'bob'})
+
+    def test_transaction_per_thread(self, mock_odoo):
+        mock_odoo.return_value.execute.return_value = self.partner_fields
+        client = OdooClient(self.conf)
+        env = mock_odoo.return_value.env.__getitem__.return_value
+
+        def other_thread():
+            client.partners.write(2, {'name': 'alice'}, only_changed=False)
+
+        with client.transaction():
+            client.partners.write(1, {'name': 'bob'}, only_changed=False)
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+            env.write.assert_called_once_with([2], {'name': 'alice'})
+
+        env.write.assert_called_with([1], {'name': 'bob'})
+
+
+class ReconnectingODOOTests(SimpleTestCase):
+
+    login_response = {'result': {'uid': 1, 'user_context': {}}}
+
+    def _get_odoo(self, responses):
+        odoo = ReconnectingODOO('odoo.example.com', port=8069, version='8.0')
+        odoo._connector = mock.Mock()
+        odoo._connector.version = '8.0'
+        odoo._connector.proxy_json.side_effect = (
+            [self.login_response] + responses)
+        odoo.login('db', 'user', 'pass')
+        return odoo
+
+    def test_relogin_and_retry_on_expired_session(self):
+        expired = {'error': {'code': 100, 'data': {
+            'name': 'odoo.http.SessionExpiredException',
+            'message': 'Session expired'}}}
+        odoo = self._get_odoo(
+            [expired, self.login_response, {'result': 42}])
+
+        self.assertEqual(odoo.execute('res.partner', 'search_count', []), 42)
+        self.assertEqual(odoo._connector.proxy_json.call_count, 4)
+
+    def test_relogin_and_retry_on_refused_connection(self):
+        refused = URLError(socket.error(
+            errno.ECONNREFUSED, "Connection refused"))
+        odoo = self._get_odoo([refused, self.login_response, {'result': 42}])
+
+        self.assertEqual(odoo.execute('res.partner', 'search_count', []), 42)
+
+    def test_timeouts_not_retried(self):
+        odoo = self._get_odoo([URLError(socket.timeout("timed out"))])
+
+        self.assertRaises(
+            URLError, odoo.execute, 'res.partner', 'create', {'name': 'a'})
+        self.assertEqual(odoo._connector.proxy_json.call_count, 2)
+
+    def test_dropped_connections_not_retried(self):
+        reset = socket.error(errno.ECONNRESET, "Connection reset")
+        odoo = self._get_odoo([URLError(reset)])
+
+        self.assertRaises(
+            URLError, odoo.execute, 'res.partner', 'create', {'name': 'a'})
+        self.assertEqual(odoo._connector.proxy_json.call_count, 2)
+
+    def test_other_errors_not_retried(self):
+        error = {'error': {'code': 200, 'data': {
+            'name': 'odoo.exceptions.AccessError',
+            'message': 'Access denied'}}}
+        odoo = self._get_odoo([error])
+
+        self.assertRaises(
+            odoorpc.error.RPCError,
+            odoo.execute, 'res.partner', 'search_count', [])
+        self.assertEqual(odoo._connector.proxy_json.call_count, 2)
+
+    def test_retried_only_once(self):
+        refused = socket.error(errno.ECONNREFUSED, "Connection refused")
+        odoo = self._get_odoo([refused, self.login_response, refused])
+
+        self.assertRaises(
+            socket.error, odoo.execute, 'res.partner', 'search_count', [])
+
+
+class EchoHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.GzipFile(fileobj=io.BytesIO(body)).read()
+        self.server.connections.add(self.client_address)
+        self.server.sockets.append(self.connection)
+        self.server.requests.append(body)
+        if json.loads(body.decode('utf-8')).get('drop'):
+            # Acted on, but the connection is lost before the response.
+            self.close_connection = True
+            return
+
+        response = json.dumps({'result': json.loads(body.decode('utf-8'))})
+        response = response.encode('utf-8')
+        self.send_response(200)
+        if 'gzip' in self.headers.get('Accept-Encoding', ''):
+            response = gzip_bytes(response)
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class KeepAliveTransportTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), EchoHandler)
+        self.server.connections = set()
+        self.server.sockets = []
+        self.server.requests = []
+        self.thread = threading.Thread(
+            target=self.server.serve_forever, kwargs={'poll_interval': 0.01})
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%s/jsonrpc' % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+
+    def _post(self, opener, data):
+        response = opener.open(self.url, json.dumps(data).encode('utf-8'))
+        return json.loads(response.read().decode('utf-8'))
+
+    def test_default_transport(self):
+        self.assertIsNone(get_opener({}))
+
+    def test_unknown_transport(self):
+        self.assertRaises(ValueError, get_opener, {'transport': 'carrier'})
+
+    def test_connection_reused(self):
+        opener = get_opener({'transport': 'keepalive'})
+
+        self.assertEqual(self._post(opener, {'a': 1}), {'result': {'a': 1}})
+        self.assertEqual(self._post(opener, {'b': 2}), {'result': {'b': 2}})
+        self.assertEqual(len(self.server.connections), 1)
+
+    def test_closed_idle_connection_replaced(self):
+        opener = get_opener({'transport': 'keepalive'})
+        self._post(opener, {'a': 1})
+        # The server closes the connection while it's idle.
+        self.server.sockets[0].shutdown(socket.SHUT_RDWR)
+        time.sleep(0.1)
+
+        self.assertEqual(self._post(opener, {'b': 2}), {'result': {'b': 2}})
+        self.assertEqual(len(self.server.connections), 2)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_lost_response_not_resent(self):
+        opener = get_opener({'transport': 'keepalive'})
+        self._post(opener, {'a': 1})
+
+        self.assertRaises(URLError, self._post, opener, {'drop': 1})
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_compression(self):
+        opener = get_opener({
+            'transport': 'keepalive', 'compress_requests': True,
+            'compress_responses': True})
+
+        self.assertEqual(self._post(opener, {'a': 1}), {'result': {'a': 1}})
+
+
+class LocalCacheTests(SimpleTestCase):
+
+    def test_least_recently_used_dropped(self):
+        cache = LocalCache(max_size=2)
+        cache.set_many({'a': 1, 'b': 2})
+        cache.get_many(['a'])
+        cache.set_many({'c': 3})
+
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
+
+    @mock.patch('odoo_actions.odoo_client.cache.time')
+    def test_entries_expire(self, mock_time):
+        mock_time.time.return_value = 100
+        cache = LocalCache(ttl=10)
+        cache.set_many({'a': 1})
+
+        mock_time.time.return_value = 109
+        self.assertEqual(cache.get_many(['a']), {'a': 1})
+        mock_time.time.return_value = 110
+        self.assertEqual(cache.get_many(['a']), {})
+
+
+class SingleFlightTests(SimpleTestCase):
+
+    def _start_leader(self, flight, func):
+        started = threading.Event()
+        release = threading.Event()
+        results = []
+
+        def leader_func():
+            started.set()
+            release.wait(5)
+            return func()
+
+        def leader():
+            try:
+                results.append(flight.do('res.partner', 'key', leader_func))
+            except Exception as e:
+                results.append(e)
+
+        thread = threading.Thread(target=leader)
+        thread.start()
+        started.wait(5)
+        return thread, release, results
+
+    def _follow(self, flight, func):
+        results = []
+
+        def follower():
+            try:
+                results.append(flight.do('res.partner', 'key', func))
+            except Exception as e:
+                results.append(e)
+
+        thread = threading.Thread(target=follower)
+        thread.start()
+        # Give it the chance to join the leader's call.
+        time.sleep(0.1)
+        return thread, results
+
+    def test_concurrent_calls_shared(self):
+        flight = SingleFlight()
+        func = mock.Mock(return_value=[1])
+        leader, release, leader_results = self._start_leader(flight, func)
+        follower, follower_results = self._follow(flight, func)
+
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(func.call_count, 1)
+        self.assertEqual(leader_results, [[1]])
+        self.assertEqual(follower_results, [[1]])
+
+    def test_errors_shared(self):
+        flight = SingleFlight()
+        func = mock.Mock(side_effect=ValueError("boom"))
+        leader, release, leader_results = self._start_leader(flight, func)
+        follower, follower_results = self._follow(flight, func)
+
+        release.set()
+        leader.join()
+        follower.join()
+
+        self.assertEqual(func.call_count, 1)
+        self.assertIsInstance(follower_results[0], ValueError)
+
+    def test_invalidate_starts_new_call(self):
+        flight = SingleFlight()
+        func = mock.Mock(return_value=[1])
+        leader, release, _ = self._start_leader(flight, func)
+
+        flight.invalidate('res.partner')
+        self.assertEqual(flight.do('res.partner', 'key', func), [1])
+
+        release.set()
+        leader.join()
+        self.assertEqual(func.call_count, 2)
+
+
+class SchemaStoreTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.fetch = mock.Mock(return_value={'name': {'type': 'char'}})
+
+    def test_persisted(self):
+        key = ('odoo.example.com', 'db', 'res.partner')
+        SchemaStore(self.cache_dir).get(key, 'res.partner', '11.0', self.fetch)
+
+        # As if after a restart.
+        schema = SchemaStore(self.cache_dir).get(
+            key, 'res.partner', '11.0', self.fetch)
+
+        self.assertEqual(schema.fields, {'name': {'type': 'char'}})
+        self.assertEqual(self.fetch.call_count, 1)
+
+    def test_refetched_for_new_version(self):
+        key = ('odoo.example.com', 'db', 'res.partner')
+        SchemaStore(self.cache_dir).get(key, 'res.partner', '11.0', self.fetch)
+        SchemaStore(self.cache_dir).get(key, 'res.partner', '12.0', self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 2)
+
+    @mock.patch('odoo_actions.odoo_client.schema.time')
+    def test_refetched_when_old(self, mock_time):
+        key = ('odoo.example.com', 'db', 'res.partner')
+        store = SchemaStore(self.cache_dir, ttl=60)
+        mock_time.time.return_value = 100
+        store.get(key, 'res.partner', '11.0', self.fetch)
+        mock_time.time.return_value = 159
+        store.get(key, 'res.partner', '11.0', self.fetch)
+        mock_time.time.return_value = 160
+        store.get(key, 'res.partner', '11.0', self.fetch)
+
+        self.assertEqual(self.fetch.call_count, 2)
+
+
+class BrowseFieldsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.rows = {
+            1: {'id': 1, 'name': 'bob', 'city': 'Wellington',
+                'street': '1 Main St', 'country_id': 3},
+            2: {'id': 2, 'name': 'alice', 'city': 'Auckland',
+                'street': '2 Queen St', 'country_id': False},
+        }
+        self.odoo = mock.Mock(config={'auto_context': True})
+        self.odoo.execute_kw.side_effect = self.execute_kw
+        env = mock.Mock(context={'lang': 'en_US'})
+        columns = {}
+        for name, field_type in [('name', 'char'), ('city', 'char'),
+                                 ('street', 'char'),
+                                 ('country_id', 'many2one')]:
+            columns[name] = odoorpc.fields.generate_field(
+                name, {'type': field_type, 'relation': 'res.country',
+                       'string': name})
+        attrs = dict(columns, _name='res.partner', _columns=columns,
+                     _env=env, _odoo=self.odoo)
+        self.model = type('res.partner', (odoorpc.models.Model, ), attrs)
+
+    def execute_kw(self, model, method, args, kwargs):
+        ids, fields = args
+        return [dict((name, self.rows[res_id][name])
+                     for name in ['id'] + fields)
+                for res_id in ids if res_id in self.rows]
+
+    def test_reads_only_projected_fields(self):
+        partners = browse_fields(self.model, [1, 2], ['id', 'name'])
+
+        self.assertEqual([p.name for p in partners], ['bob', 'alice'])
+        self.odoo.execute_kw.assert_called_once_with(
+            'res.partner', 'read', ([1, 2], ['name']),
+            {'context': {'lang': 'en_US'}, 'load': '_classic_write'})
+
+    def test_other_fields_read_once_for_recordset(self):
+        partners = browse_fields(self.model, [1, 2], ['name'])
+
+        self.assertEqual([p.city for p in partners],
+                         ['Wellington', 'Auckland'])
+        self.assertEqual([p.street for p in partners],
+                         ['1 Main St', '2 Queen St'])
+        # All the missing non-relational fields in one call.
+        self.assertEqual(self.odoo.execute_kw.call_count, 2)
+        self.odoo.execute_kw.assert_called_with(
+            'res.partner', 'read', ([1, 2], ['city', 'street']),
+            {'context': {'lang': 'en_US'}, 'load': '_classic_write'})
+
+    def test_relational_field_read_with_missing_fields(self):
+        partners = browse_fields(self.model, [1, 2], ['name'])
+
+        self.assertEqual(partners[0]._values['country_id'][1], 3)
+        self.assertEqual(partners[1].street, '2 Queen St')
+        self.assertEqual(self.odoo.execute_kw.call_count, 2)
+        self.odoo.execute_kw.assert_called_with(
+            'res.partner', 'read', ([1, 2], ['country_id', 'city', 'street']),
+            {'context': {'lang': 'en_US'}, 'load': '_classic_write'})
+
+    def test_missing_ids(self):
+        self.assertRaises(
+            ValueError, browse_fields, self.model, [1, 5], ['name'])
+
+
+class NgramIndexTests(SimpleTestCase):
+
+    def test_search(self):
+        index = NgramIndex()
+        index.add(1, "Catalyst Cloud")
+        index.add(2, "Catalyst IT")
+        index.add(2, "Catalyst Information Technology")
+        index.add(3, "Cloud Company")
+
+        matches = index.search("catalyst  cloud!")
+        self.assertEqual(matches[0], (1, 1.0))
+        self.assertEqual([key for key, score in matches], [1, 2, 3])
+        self.assertEqual(
+            [key for key, score in index.search("Catalyst", 0.5)], [2, 1])
+
+    def test_equal_scores_ordered_by_key(self):
+        index = NgramIndex()
+        for key in ['NU', 'GB', 'NZ', 'AU']:
+            index.add(key, "Island")
+
+        self.assertEqual(
+            index.search("Island"),
+            [('AU', 1.0), ('GB', 1.0), ('NU', 1.0), ('NZ', 1.0)])
+        self.assertEqual(index.search("Island", limit=1), [('AU', 1.0)])
+
+    def test_accents_and_case(self):
+        index = NgramIndex()
+        index.add(1, u"Cura\xe7ao")
+
+        self.assertEqual(index.search("CURACAO"), [(1, 1.0)])
+
+    def test_remove(self):
+        index = NgramIndex()
+        index.add(1, "Catalyst Cloud")
+        index.add(2, "Cloud Company")
+
+        index.remove(1)
+
+        self.assertNotIn(1, index)
+        self.assertEqual(
+            [key for key, score in index.search("Catalyst Cloud")], [2])
+
+
+ALPHA3 = {'GB': 'GBR', 'NZ': 'NZL', 'NU': 'NIU'}
+
+
+@mock.patch('odoo_actions.odoo_client.country_index.alpha3', ALPHA3.get)
+class CountryManagerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = mock.Mock(
+            supports_search_read=True, current_transaction=None,
+            country_aliases={'gb': ['UK', 'Great Britain']})
+        self.env = self.client.get_model.return_value
+        self.env.search_read.return_value = [
+            {'id': 1, 'name': 'United Kingdom', 'code': 'GB'},
+            {'id': 3, 'name': 'New Zealand', 'code': 'NZ'},
+            {'id': 4, 'name': 'Niue', 'code': 'NU'},
+        ]
+        self.manager = CountryManager(self.client)
+        self.manager.index = CountryIndex()
+
+    def test_lookups_use_index(self):
+        self.assertEqual(self.manager.get_closest_country('nz').id, 3)
+        self.assertEqual(
+            self.manager.get_closest_country('united  kingdom').code, 'GB')
+        self.assertEqual(
+            self.manager.get([3, 1], read=True),
+            [{'id': 3, 'name': 'New Zealand', 'code': 'NZ'},
+             {'id': 1, 'name': 'United Kingdom', 'code': 'GB'}])
+
+        self.env.search_read.assert_called_once_with(
+            [], fields=self.manager.fields)
+        self.env.read.assert_not_called()
+
+    def test_fuzzy_match(self):
+        matches = self.manager.fuzzy_match('New Zeland', threshold=0.5)
+        self.assertEqual([match['id'] for match in matches], [3])
+        self.assertGreater(matches[0]['match'], 0.7)
+        self.assertLess(matches[0]['match'], 1)
+
+        self.assertEqual(
+            self.manager.fuzzy_match('NZL'),
+            [{'id': 3, 'name': 'New Zealand', 'match': 1.0}])
+        self.assertEqual(self.manager.fuzzy_match('great britian'), [])
+        self.assertEqual(
+            self.manager.fuzzy_match('great britian', 0.6)[0]['id'], 1)
+        self.assertEqual(self.manager.get_closest_country('uk').id, 1)
+
+    def test_ranked(self):
+        matches = self.manager.fuzzy_match('Niu Zealand', threshold=0)
+
+        self.assertEqual([match['id'] for match in matches], [3, 4])
+        self.assertGreater(matches[0]['match'], matches[1]['match'])
+
+    def test_no_match(self):
+        self.assertEqual(self.manager.fuzzy_match('XX'), [])
+        self.assertRaises(
+            IndexError, self.manager.get_closest_country, 'XX')
+
+    def test_unindexed_reads_go_to_odoo(self):
+        self.env.read.return_value = [
+            {'id': 5, 'name': 'Tokelau', 'code': 'TK'}]
+
+        self.assertEqual(self.manager.get(5, read=True)[0]['code'], 'TK')
+        self.env.read.assert_called_once_with(
+            [5], fields=self.manager.fields)
+
+    def test_reload(self):
+        self.manager.fuzzy_match('NZ')
+        self.env.search_read.return_value = [
+            {'id': 3, 'name': 'Aotearoa New Zealand', 'code': 'NZ'}]
+
+        self.manager.load_index()
+
+        self.assertEqual(
+            self.manager.fuzzy_match('NZ')[0]['name'],
+            'Aotearoa New Zealand')
+
+
+class PartnerManagerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = mock.Mock(
+            supports_search_read=True, current_transaction=None)
+        self.env = self.client.get_model.return_value
+        self.env.search_read.return_value = [
+            {'id': 1, 'name': 'Catalyst Cloud', 'is_company': True,
+             'parent_id': False},
+            {'id': 2, 'name': 'Catalyst IT', 'is_company': True,
+             'parent_id': False},
+            {'id': 3, 'name': 'Jane Smith', 'is_company': False,
+             'parent_id': [1, 'Catalyst Cloud']},
+            {'id': 4, 'name': 'Jane Smith', 'is_company': False,
+             'parent_id': [2, 'Catalyst IT']},
+            {'id': 5, 'name': 'John Smith', 'is_company': False,
+             'parent_id': [1, 'Catalyst Cloud']},
+        ]
+        self.client.get_schema.return_value.clean.side_effect = dict
+        self.manager = PartnerManager(self.client)
+        self.manager.index = PartnerIndex()
+        self.manager.sync = PartnerSync(
+            [self.manager.index], pull_max_age=60)
+        self.manager.sync_index()
+        self.env.search_read.reset_mock()
+
+    def test_fuzzy_match_companies(self):
+        self.assertEqual(
+            self.manager.fuzzy_match('catalyst cloud', is_company=True),
+            [{'id': 1, 'name': 'Catalyst Cloud', 'match': 1.0}])
+
+        matches = self.manager.fuzzy_match(
+            'Catalyst Clouds Ltd', is_company=True, threshold=0.7)
+        self.assertEqual([match['id'] for match in matches], [1])
+        self.assertLess(matches[0]['match'], 1)
+
+        self.assertEqual(
+            self.manager.fuzzy_match('Jane Smith', is_company=True), [])
+
+    def test_fuzzy_match_contacts_of_parent(self):
+        matches = self.manager.fuzzy_match(
+            'Jane Smyth', check_parent=True, parent=1, threshold=0.5)
+        self.assertEqual([match['id'] for match in matches], [3])
+
+        matches = self.manager.fuzzy_match('Jane Smith', threshold=0.5)
+        self.assertEqual(
+            sorted(match['id'] for match in matches), [3, 4, 5])
+        self.assertEqual(matches[-1]['id'], 5)
+
+    def test_fuzzy_match_many(self):
+        with mock.patch.object(
+                self.manager.index, 'match_many',
+                wraps=self.manager.index.match_many) as match_many:
+            company, jane, bob, jane_again = self.manager.fuzzy_match_many([
+                {'name': 'Catalyst Cloud', 'is_company': True},
+                {'name': 'Jane Smith', 'check_parent': True, 'parent': 1},
+                {'name': 'Bob Smith', 'check_parent': True, 'parent': 2},
+                {'name': 'Jane Smith', 'check_parent': True, 'parent': 1},
+            ])
+
+        match_many.assert_called_once()
+        # Synced too recently to pull changes.
+        self.env.search_read.assert_not_called()
+        self.assertEqual(
+            company, [{'id': 1, 'name': 'Catalyst Cloud', 'match': 1.0}])
+        self.assertEqual([match['id'] for match in jane], [3])
+        self.assertEqual(bob, [])
+        self.assertEqual(jane_again, jane)
+        self.assertIsNot(jane_again, jane)
+
+    def test_match_pulls_changes_outside_identity_map(self):
+        self.manager.sync.pull_max_age = 0
+
+        with identity_map.scope() as id_map:
+            self.manager.fuzzy_match('Catalyst', is_company=True)
+            self.assertEqual(id_map.get_rows('res.partner', [1], ['name']),
+                             None)
+
+        self.env.search_read.assert_called_once_with(
+            [('active', 'in', [True, False]), ('id', '>', 0)],
+            fields=partner_sync.FIELDS, limit=500, order='id')
+
+    def test_exact_match_before_index_loaded(self):
+        self.manager.sync = PartnerSync([PartnerIndex()])
+        self.env.search_read.return_value = [
+            {'id': 1, 'name': 'Catalyst Cloud'}]
+
+        matches = self.manager.fuzzy_match('Catalyst Cloud', is_company=True)
+
+        self.assertEqual(
+            matches, [{'id': 1, 'name': 'Catalyst Cloud', 'match': 1}])
+        self.env.search_read.assert_called_once_with(
+            [('is_company', '=', True), ('name', '=', 'Catalyst Cloud')],
+            fields=['name'])
+
+    def test_own_changes_indexed(self):
+        self.env.create.return_value = 6
+        self.manager.create(name='Catalyst Labs', is_company=True)
+        self.assertEqual(
+            self.manager.fuzzy_match('Catalyst Labs', is_company=True),
+            [{'id': 6, 'name': 'Catalyst Labs', 'match': 1.0}])
+
+        self.env.read.return_value = [
+            {'id': 6, 'name': 'Catalyst Workshop', 'is_company': True,
+             'parent_id': False, 'active': True}]
+        self.manager.write(6, {'name': 'Catalyst Workshop'},
+                           only_changed=False)
+        self.env.read.assert_called_once_with(
+            [6], fields=partner_sync.FIELDS)
+        self.assertEqual(
+            self.manager.fuzzy_match('Catalyst Labs', is_company=True), [])
+        self.assertEqual(
+            self.manager.fuzzy_match('Catalyst Workshop', is_company=True),
+            [{'id': 6, 'name': 'Catalyst Workshop', 'match': 1.0}])
+
+        self.manager.delete(6)
+        self.assertNotIn(6, self.manager.index)
+        self.env.search_read.assert_not_called()
+
+    def test_created_contacts_indexed(self):
+        self.env.create.side_effect = [7, odoorpc.error.RPCError("bad"), 9]
+        self.client.supports_create_multi = False
+
+        with self.assertRaises(BulkCreateError):
+            self.manager.create_many([
+                {'name': 'Amy Jones', 'parent_id': 1},
+                {'name': 'Bad Contact', 'parent_id': 1},
+                {'name': 'Sam Jones', 'parent_id': 1},
+            ])
+
+        matches = self.manager.fuzzy_match(
+            'Jones', check_parent=True, parent=1, threshold=0.3)
+        self.assertEqual(sorted(match['id'] for match in matches), [7, 9])
+
+    def test_index_update(self):
+        index = self.manager.index
+        index.load(self.env.search_read.return_value)
+
+        index.update([{'id': 5, 'name': 'John Smith', 'is_company': False,
+                       'parent_id': [2, 'Catalyst IT']}])
+        index.remove([3])
+
+        self.assertEqual(
+            index.match('John Smith', check_parent=True, parent=1), [])
+        self.assertEqual(
+            index.match('John Smith', check_parent=True, parent=2)[0][0], 5)
+        self.assertNotIn(3, index)
+        self.assertEqual(len(index), 4)
+
+
+class PartnerSyncTests(SimpleTestCase):
+
+    def setUp(self):
+        self.partners = {
+            1: {'id': 1, 'name': 'Catalyst Cloud', 'is_company': True,
+                'parent_id': False, 'active': True,
+                'write_date': '2018-01-01 10:00:00'},
+            2: {'id': 2, 'name': 'Catalyst IT', 'is_company': True,
+                'parent_id': False, 'active': True,
+                'write_date': '2018-01-02 10:00:00'},
+        }
+        self.manager = mock.Mock()
+        self.manager.iter_list.side_effect = self.iter_list
+        self.manager.list.side_effect = lambda filters, get: sorted(
+            res_id for res_id, row in self.partners.items() if row['active'])
+        self.index = PartnerIndex()
+        self.sync = PartnerSync([self.index], deletion_check_interval=600)
+
+    def iter_list(self, filters, fields):
+        rows = sorted(self.partners.values(), key=lambda row: row['id'])
+        if not any(name == 'active' for name, _, _ in filters):
+            rows = [row for row in rows if row['active']]
+        for name, operator, value in filters:
+            if name == 'write_date':
+                rows = [row for row in rows if row['write_date'] >= value]
+            elif name == 'id':
+                rows = [row for row in rows if row['id'] in value]
+        return [dict(row) for row in rows]
+
+    def names(self, name='Catalyst'):
+        return [partner_id for partner_id, _, _ in self.index.match(
+            name, is_company=True, threshold=0.3)]
+
+    def test_changes_since_high_water(self):
+        self.sync.sync(self.manager)
+        self.assertEqual(self.sync.high_water, '2018-01-02 10:00:00')
+
+        self.partners[1].update(
+            name='Catalyst Cloud Ltd', write_date='2018-01-03 09:00:00')
+        self.partners[3] = {
+            'id': 3, 'name': 'Catalyst Labs', 'is_company': True,
+            'parent_id': False, 'active': True,
+            'write_date': '2018-01-03 09:00:00'}
+        with mock.patch.object(
+                self.index, 'update', wraps=self.index.update) as update:
+            self.sync.sync(self.manager)
+
+        self.manager.iter_list.assert_called_with(
+            [('active', 'in', [True, False]),
+             ('write_date', '>=', '2018-01-02 09:59:00')],
+            fields=partner_sync.FIELDS)
+        # Only the partners written since (a minute before) the last
+        # write seen.
+        self.assertEqual(
+            [row['id'] for row in update.call_args[0][0]], [1, 2, 3])
+        self.assertEqual(self.sync.high_water, '2018-01-03 09:00:00')
+        self.assertEqual(self.names('Catalyst Cloud Ltd')[0], 1)
+        self.assertIn(3, self.index)
+
+    def test_archived_partners_removed(self):
+        self.sync.sync(self.manager)
+        self.partners[2].update(
+            active=False, write_date='2018-01-03 09:00:00')
+
+        self.sync.sync(self.manager)
+
+        self.assertNotIn(2, self.index)
+        self.manager.list.assert_not_called()
+
+    def test_deletions_found_by_id_check(self):
+        self.sync.sync(self.manager)
+        del self.partners[2]
+
+        self.sync.sync(self.manager)
+        self.assertIn(2, self.index)
+
+        self.sync.checked_deletions_at -= 600
+        self.sync.sync(self.manager)
+        self.assertNotIn(2, self.index)
+        self.manager.list.assert_called_once_with([], get=False)
+
+    def test_pull(self):
+        self.sync.pull(self.manager)
+        # The first sync is left to the syncer.
+        self.manager.iter_list.assert_not_called()
+
+        self.sync.sync(self.manager)
+        self.partners[2].update(
+            name='Catalyst Labs', write_date='2018-01-03 09:00:00')
+        # Synced too recently.
+        self.sync.pull(self.manager)
+        self.assertEqual(
+            self.index.match('Catalyst Labs', is_company=True, threshold=1),
+            [])
+
+        self.sync.synced_at -= self.sync.pull_max_age
+        self.sync.pull(self.manager)
+        self.assertEqual(
+            self.index.match('Catalyst Labs', is_company=True, threshold=1),
+            [(2, 'Catalyst Labs', 1.0)])
+        self.assertEqual(self.manager.iter_list.call_count, 2)
+        self.manager.list.assert_not_called()
+
+    def test_syncer_loads_straight_away(self):
+        pool = mock.MagicMock()
+        client = pool.client.return_value.__enter__.return_value
+
+        syncer = partner_sync.PartnerSyncer(pool, interval=60)
+        syncer.stop()
+        syncer.run()
+
+        client.partners.sync_index.assert_called_once_with()
+
+    def test_apply_own_changes(self):
+        self.sync.apply([{'id': 3, 'name': 'Catalyst Labs',
+                          'is_company': True}])
+        # Nothing to apply them to before the first sync.
+        self.assertNotIn(3, self.index)
+
+        self.sync.sync(self.manager)
+        self.sync.apply([
+            {'id': 3, 'name': 'Catalyst Labs', 'is_company': True},
+            {'id': 2, 'name': 'Catalyst IT', 'is_company': True,
+             'active': False},
+        ])
+        self.sync.remove([1])
+
+        self.assertEqual(self.names(), [3])
+        # The next sync still reads everything written since the last.
+        self.assertEqual(self.sync.high_water, '2018-01-02 10:00:00')
+        self.manager.iter_list.reset_mock()
+        self.sync.sync(self.manager)
+        self.manager.iter_list.assert_called_once_with(
+            [('active', 'in', [True, False]),
+             ('write_date', '>=', '2018-01-02 09:59:00')],
+            fields=partner_sync.FIELDS)
+
+    def test_late_commits_in_overlap(self):
+        self.sync.sync(self.manager)
+        # Written before the last sync, but committed after it.
+        self.partners[3] = {
+            'id': 3, 'name': 'Catalyst Labs', 'is_company': True,
+            'parent_id': False, 'active': True,
+            'write_date': '2018-01-02 09:59:30'}
+        self.partners[4] = {
+            'id': 4, 'name': 'Catalyst Works', 'is_company': True,
+            'parent_id': False, 'active': True,
+            'write_date': '2018-01-02 09:58:00'}
+
+        self.sync.sync(self.manager)
+
+        self.assertIn(3, self.index)
+        # Too late to be read until the id check.
+        self.assertNotIn(4, self.index)
+        self.assertEqual(self.sync.high_water, '2018-01-02 10:00:00')
+
+    def test_pull_skipped_while_syncing(self):
+        self.sync.sync(self.manager)
+        self.sync.synced_at -= self.sync.pull_max_age
+
+        def iter_list(filters, fields):
+            # A lookup meanwhile doesn't wait for this read.
+            self.sync.pull(self.manager)
+            return self.iter_list(filters, fields)
+
+        self.manager.iter_list.reset_mock()
+        self.manager.iter_list.side_effect = iter_list
+        self.sync.sync(self.manager)
+
+        self.manager.iter_list.assert_called_once_with(
+            [('active', 'in', [True, False]),
+             ('write_date', '>=', '2018-01-02 09:59:00')],
+            fields=partner_sync.FIELDS)
+
+    def test_apply_not_blocked_by_sync(self):
+        self.sync.sync(self.manager)
+        row = {'id': 3, 'name': 'Catalyst Labs', 'is_company': True}
+
+        def iter_list(filters, fields):
+            # Would deadlock if the read held the index lock.
+            self.sync.apply([row])
+            return self.iter_list(filters, fields)
+
+        self.manager.iter_list.side_effect = iter_list
+        self.sync.sync(self.manager)
+
+        self.assertIn(3, self.index)
+
+
+class BaseManagerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.client = mock.Mock(
+            supports_search_read=True, supports_create_multi=True,
+            current_transaction=None)
+        self.client.get_schema.return_value.clean.side_effect = dict
+        self.env = self.client.get_model.return_value
+        self.manager = PartnerManager(self.client)
+
+    def test_list_read_uses_search_read(self):
+        self.env.search_read.return_value = [{'id': 1, 'name': 'bob'}]
+
+        partners = self.manager.list(
+            [('name', '=', 'bob')], read=True, fields=['name'], limit=5,
+            order='name')
+
+        self.assertEqual(partners, [{'id': 1, 'name': 'bob'}])
+        self.env.search_read.assert_called_once_with(
+            [('name', '=', 'bob')], fields=['name'], limit=5, order='name')
+        self.env.search.assert_not_called()
+        self.env.read.assert_not_called()
+
+    def test_list_read_falls_back_without_search_read(self):
+        message = "'res.partner' object has no attribute 'search_read'"
+        self.env.search_read.side_effect = odoorpc.error.RPCError(
+            message, {'code': 200, 'message': 'Odoo Server Error',
+                      'data': {'name': 'exceptions.AttributeError',
+                               'message': message}})
+        self.env.search.return_value = [1]
+
+        self.manager.list([('name', '=', 'bob')], read=True)
+        self.manager.list([('name', '=', 'bob')], read=True)
+
+        self.assertFalse(self.client.supports_search_read)
+        self.assertEqual(self.env.search_read.call_count, 1)
+        self.env.read.assert_called_with(
+            [1], fields=PartnerManager.fields)
+
+    def test_list_other_errors_raised(self):
+        for message, name in [
+                ("Access denied", 'odoo.exceptions.AccessError'),
+                # Not about the method, even if it mentions it.
+                ("Invalid field 'search_read_count' in search_read",
+                 'builtins.ValueError')]:
+            self.env.search_read.side_effect = odoorpc.error.RPCError(
+                message, {'code': 200, 'message': 'Odoo Server Error',
+                          'data': {'name': name, 'message': message}})
+
+            self.assertRaises(
+                odoorpc.error.RPCError,
+                self.manager.list, [('name', '=', 'bob')], read=True)
+            self.assertTrue(self.client.supports_search_read)
+
+    def test_iter_list_pages_by_id(self):
+        rows = [{'id': i} for i in range(1, 6)]
+
+        def search_read(filters, fields=None, limit=None, order=None):
+            last_id = filters[-1][2]
+            return [row for row in rows if row['id'] > last_id][:limit]
+        self.env.search_read.side_effect = search_read
+
+        records = self.manager.iter_list([], chunk_size=2)
+
+        self.assertEqual(list(records), rows)
+        self.assertEqual(self.env.search_read.call_count, 3)
+        self.env.search_read.assert_called_with(
+            [('id', '>', 4)], fields=PartnerManager.fields, limit=2,
+            order='id')
+
+    def test_iter_list_pages_by_offset(self):
+        rows = [{'id': i} for i in range(1, 5)]
+
+        def search_read(filters, fields=None, limit=None, offset=0,
+                        order=None):
+            return rows[offset:offset + limit]
+        self.env.search_read.side_effect = search_read
+
+        records = self.manager.iter_list([], chunk_size=2, order='name')
+
+        self.assertEqual(list(records), rows)
+        # The last page is empty, as the one before it was full.
+        self.assertEqual(self.env.search_read.call_count, 3)
+
+    def test_exists(self):
+        self.env.search.return_value = [3]
+
+        self.assertTrue(self.manager.exists([('name', '=', 'bob')]))
+        self.env.search.assert_called_once_with(
+            [('name', '=', 'bob')], limit=1)
+
+    def test_exists_ids(self):
+        search = self.env.with_context.return_value.search
+        search.return_value = [1, 3]
+
+        self.assertEqual(self.manager.exists_ids([3, 2, 1]), [3, 1])
+        self.env.with_context.assert_called_once_with(active_test=False)
+        search.assert_called_once_with([('id', 'in', [3, 2, 1])])
+
+    def test_create_many_in_one_call(self):
+        self.env.create.return_value = [4, 5]
+
+        ids = self.manager.create_many([{'name': 'a'}, {'name': 'b'}])
+
+        self.assertEqual(ids, [4, 5])
+        self.env.create.assert_called_once_with(
+            [{'name': 'a'}, {'name': 'b'}])
+
+    def test_create_many_reports_failed_records(self):
+        self.env.create.side_effect = [
+            odoorpc.error.RPCError("bad field"), 4,
+            odoorpc.error.RPCError("bad field"), 6]
+
+        with self.assertRaises(BulkCreateError) as cm:
+            self.manager.create_many(
+                [{'name': 'a'}, {'nmae': 'b'}, {'name': 'c'}])
+
+        self.assertEqual(cm.exception.ids, [4, None, 6])
+        self.assertEqual(list(cm.exception.errors), [1])
+
+    def test_create_many_one_at_a_time_on_old_servers(self):
+        self.client.supports_create_multi = False
+        self.env.create.side_effect = [4, 5]
+
+        ids = self.manager.create_many([{'name': 'a'}, {'name': 'b'}])
+
+        self.assertEqual(ids, [4, 5])
+        self.env.create.assert_called_with({'name': 'b'})
+
+    def test_write_only_changed(self):
+        current = {'id': 1, 'name': 'bob', 'city': False,
+                   'country_id': [3, 'New Zealand']}
+
+        written = self.manager.write(
+            1, {'name': 'bob', 'city': 'Wellington', 'country_id': 3},
+            current=current)
+
+        self.assertEqual(written, {'city': 'Wellington'})
+        self.env.write.assert_called_once_with([1], {'city': 'Wellington'})
+        self.env.read.assert_not_called()
+
+    def test_write_nothing_changed(self):
+        self.env.read.return_value = [{'id': 1, 'name': 'bob', 'zip': False}]
+
+        written = self.manager.write([1], {'name': 'bob', 'zip': ''})
+
+        self.assertEqual(written, {})
+        self.env.read.assert_called_once_with([1], fields=['name', 'zip'])
+        self.env.write.assert_not_called()
+
+    def test_write_all(self):
+        self.manager.write([1, 2], {'name': 'bob'}, only_changed=False)
+
+        self.env.write.assert_called_once_with([1, 2], {'name': 'bob'})
+        self.env.read.assert_not_called()
+
+    def _fake_load(self, fields, data):
+        if ['bad'] in data:
+            return {'ids': False, 'messages': [
+                {'type': 'error', 'message': 'bad row',
+                 'rows': {'from': 1, 'to': 1}}]}
+        return {'ids': [int(row[0]) for row in data], 'messages': []}
+
+    def test_load_stream_in_chunks(self):
+        self.env.load.side_effect = self._fake_load
+        rows = ([str(i)] for i in range(5))
+
+        result = self.manager.load_stream(['name'], rows, chunk_size=2)
+
+        self.assertEqual(result.ids, [0, 1, 2, 3, 4])
+        self.assertEqual(result.committed, set([0, 1, 2]))
+        self.assertEqual(self.env.load.call_count, 3)
+        self.env.load.assert_called_with(fields=['name'], data=[['4']])
+
+    def test_load_stream_resume(self):
+        self.env.load.side_effect = self._fake_load
+        rows = [['0'], ['1'], ['2'], ['bad'], ['4']]
+
+        result = self.manager.load_stream(['name'], rows, chunk_size=2)
+
+        self.assertEqual(result.ids, [0, 1, 4])
+        self.assertEqual(list(result.failed), [1])
+        # Rows are numbered from the start of the load.
+        self.assertEqual(result.messages[0]['rows'], {'from': 3, 'to': 3})
+
+        rows[3] = ['3']
+        self.env.load.reset_mock()
+        result = self.manager.load_stream(
+            ['name'], rows, chunk_size=2, skip_chunks=result.committed)
+
+        self.assertEqual(result.ids, [2, 3])
+        self.env.load.assert_called_once_with(
+            fields=['name'], data=[['2'], ['3']])
+
+    def test_load_stream_parallel(self):
+        self.env.load.side_effect = self._fake_load
+        other_client = mock.Mock()
+        other_client.get_model.return_value.load.side_effect = \
+            self._fake_load
+        pool = ClientPool(lambda: other_client, size=1)
+        rows = ([str(i)] for i in range(100))
+
+        result = self.manager.load_stream(
+            ['name'], rows, chunk_size=3, workers=2, pool=pool)
+
+        self.assertEqual(result.ids, list(range(100)))
+        self.assertEqual(result.failed, {})
+        self.assertEqual(pool.idle, 1)
+        self.assertEqual(
+            self.env.load.call_count +
+            other_client.get_model.return_value.load.call_count, 34)
+
+    def test_load_stream_pool_exhausted(self):
+        self.env.load.side_effect = self._fake_load
+        pool = ClientPool(mock.Mock, size=1, timeout=30)
+        client = pool.checkout()
+        rows = ([str(i)] for i in range(10))
+
+        start = time.time()
+        result = self.manager.load_stream(
+            ['name'], rows, chunk_size=3, workers=2, pool=pool)
+
+        # The extra worker gives up straight away, leaving our client
+        # to load everything.
+        self.assertLess(time.time() - start, 5)
+        self.assertEqual(result.ids, list(range(10)))
+        self.assertEqual(self.env.load.call_count, 4)
+        pool.checkin(client)
+
+    @mock.patch('odoo_actions.odoo_client.common.browse_fields')
+    def test_identity_map_get(self, browse_fields):
+        partner = mock.Mock(id=1)
+        browse_fields.return_value = [partner]
+
+        with identity_map.scope():
+            self.assertIs(self.manager.get(1)[0], partner)
+            self.assertIs(self.manager.get([1])[0], partner)
+
+        browse_fields.assert_called_once_with(
+            self.env, [1], PartnerManager.fields)
+        # Nothing is kept once the scope ends.
+        self.manager.get(1)
+        self.assertEqual(browse_fields.call_count, 2)
+
+    def test_identity_map_read_fields(self):
+        self.env.read.side_effect = [
+            [{'id': 1, 'name': 'bob'}],
+            [{'id': 1, 'name': 'bob', 'city': 'Wellington'}],
+        ]
+
+        with identity_map.scope():
+            first = self.manager.get(1, read=True, fields=['name'])[0]
+            self.manager.get(1, read=True, fields=['name'])
+            second = self.manager.get(
+                1, read=True, fields=['name', 'city'])[0]
+
+        self.assertEqual(first, {'id': 1, 'name': 'bob'})
+        self.assertEqual(second, {'id': 1, 'name': 'bob',
+                                  'city': 'Wellington'})
+        self.assertEqual(self.env.read.call_count, 2)
+
+    def test_identity_map_rows_copied(self):
+        self.env.read.return_value = [{'id': 1, 'name': 'bob'}]
+
+        with identity_map.scope():
+            row = self.manager.get(1, read=True, fields=['name'])[0]
+            row['name'] = 'jim'
+            again = self.manager.get(1, read=True, fields=['name'])[0]
+
+        self.assertEqual(again['name'], 'bob')
+        self.env.read.assert_called_once_with([1], fields=['name'])
+
+    def test_identity_map_skipped_by_iter_list(self):
+        rows = [{'id': i} for i in range(1, 6)]
+
+        def search_read(filters, fields=None, limit=None, order=None):
+            last_id = filters[-1][2]
+            return [row for row in rows if row['id'] > last_id][:limit]
+        self.env.search_read.side_effect = search_read
+
+        with identity_map.scope() as id_map:
+            records = self.manager.iter_list([], chunk_size=2)
+            first = next(records)
+            # The caller is still in the scope between chunks.
+            self.assertIs(identity_map.current(), id_map)
+            records = [first] + list(records)
+
+        self.assertEqual(records, rows)
+        self.assertEqual(id_map._rows, {})
+        self.assertEqual(id_map._searches, {})
+
+    def test_identity_map_searches(self):
+        self.env.search.return_value = [1]
+
+        with identity_map.scope():
+            self.manager.list([('name', '=', 'bob')], get=False)
+            self.manager.list([['name', '=', 'bob']], get=False)
+            self.manager.list([('name', '=', 'bob')], get=False, limit=1)
+
+        self.assertEqual(self.env.search.call_count, 2)
+
+    @mock.patch('odoo_actions.odoo_client.common.browse_fields')
+    def test_identity_map_invalidated_by_writes(self, browse_fields):
+        browse_fields.return_value = [mock.Mock(id=1)]
+        self.env.search.return_value = [1]
+
+        with identity_map.scope():
+            self.manager.get(1)
+            self.manager.list([('name', '=', 'bob')], get=False)
+            self.manager.write(1, {'name': 'alice'}, only_changed=False)
+            self.manager.get(1)
+            self.manager.list([('name', '=', 'bob')], get=False)
+
+        self.assertEqual(browse_fields.call_count, 2)
+        self.assertEqual(self.env.search.call_count, 2)
+
+    def test_read_cache(self):
+        self.manager.cache = LocalCache()
+        self.env.read.side_effect = lambda ids, fields: [
+            {'id': res_id, 'name': 'bob'} for res_id in ids]
+
+        self.manager.get([1, 2], read=True, fields=['name'])
+        partners = self.manager.get([2, 3], read=True, fields=['name'])
+
+        self.assertEqual([p['id'] for p in partners], [2, 3])
+        self.env.read.assert_called_with([3], fields=['name'])
+        # A different set of fields is cached separately.
+        self.manager.get([1], read=True)
+        self.env.read.assert_called_with([1], fields=self.manager.fields)
+        self.assertEqual(self.env.read.call_count, 3)
+
+    def test_read_cache_invalidated(self):
+        self.manager.cache = LocalCache()
+        self.env.read.return_value = [{'id': 1, 'name': 'bob'}]
+
+        self.manager.get(1, read=True)
+        self.manager.write(1, {'name': 'alice'}, only_changed=False)
+        self.manager.get(1, read=True)
+        self.manager.delete(1)
+        self.manager.get(1, read=True)
+
+        self.assertEqual(self.env.read.call_count, 3)
+
+    def test_read_cache_write_during_read(self):
+        self.manager.cache = LocalCache()
+
+        def read(ids, fields=None):
+            # Another thread writes while this read is in flight.
+            self.manager.write(1, {'name': 'alice'}, only_changed=False)
+            return [{'id': 1, 'name': 'bob'}]
+        self.env.read.side_effect = read
+
+        self.manager.get(1, read=True)
+        self.env.read.side_effect = None
+        self.env.read.return_value = [{'id': 1, 'name': 'alice'}]
+
+        # The row read before the write wasn't cached.
+        row = self.manager.get(1, read=True)[0]
+
+        self.assertEqual(row['name'], 'alice')
+        self.assertEqual(self.env.read.call_count, 2)
+
+    def test_compact_records(self):
+        self.env._columns = {'country_id': odoorpc.fields.Many2one(
+            'country_id', {'type': 'many2one', 'relation': 'res.country'})}
+        self.env.read.return_value = [
+            {'id': 1, 'name': 'bob', 'country_id': [3, 'New Zealand']},
+            {'id': 2, 'name': 'alice', 'country_id': False},
+        ]
+
+        bob, alice = self.manager.get(
+            [1, 2], compact=True, fields=['name', 'country_id'])
+
+        self.env.read.assert_called_once_with(
+            [1, 2], fields=['name', 'country_id'])
+        self.assertEqual(bob.id, 1)
+        self.assertEqual(bob.country_id, (3, 'New Zealand'))
+        self.assertEqual(alice.country_id, False)
+        self.assertFalse(hasattr(bob, '__dict__'))
+        self.assertIs(type(bob), type(alice))
+        self.assertEqual(type(bob).__name__, 'PartnerRecord')
+        self.assertEqual(
+            alice.as_dict(), {'id': 2, 'name': 'alice', 'country_id': False})
+
+    def test_compact_iter_list(self):
+        self.env.search_read.side_effect = [
+            [{'id': 1, 'name': 'a'}, {'id': 2, 'name': 'b'}],
+            [],
+        ]
+
+        records = list(self.manager.iter_list(
+            [], fields=['name'], chunk_size=2, compact=True))
+
+        self.assertEqual([r.name for r in records], ['a', 'b'])
+        self.env.search_read.assert_called_with(
+            [('id', '>', 2)], fields=['name'], limit=2, order='id')
+
+    @mock.patch('odoo_actions.odoo_client.country_index.alpha3',
+                ALPHA3.get)
+    def test_include_relations(self):
+        self.env._columns = {'country_id': odoorpc.fields.Many2one(
+            'country_id', {'type': 'many2one', 'relation': 'res.country'})}
+        self.env.search_read.return_value = [
+            {'id': 1, 'name': 'bob', 'country_id': [3, 'New Zealand']},
+            {'id': 2, 'name': 'alice', 'country_id': [3, 'New Zealand']},
+            {'id': 4, 'name': 'eve', 'country_id': False},
+        ]
+        countries = CountryManager(mock.Mock(
+            supports_search_read=True, current_transaction=None,
+            country_aliases={}))
+        countries.index = CountryIndex()
+        country_env = countries.client.get_model.return_value
+        country_env.search_read.return_value = [
+            {'id': 3, 'name': 'New Zealand', 'code': 'NZ'}]
+        self.client.get_manager.return_value = countries
+
+        bob, alice, eve = self.manager.list([], include=['country_id'])
+
+        self.client.get_manager.assert_called_once_with('res.country')
+        # Countries come from the index.
+        country_env.search_read.assert_called_once_with(
+            [], fields=countries.fields)
+        country_env.read.assert_not_called()
+        self.assertEqual(bob['country_id']['code'], 'NZ')
+        self.assertIs(bob['country_id'], alice['country_id'])
+        self.assertEqual(eve['country_id'], False)
+
+    def test_include_not_many2one(self):
+        self.env._columns = {'name': odoorpc.fields.Char(
+            'name', {'type': 'char'})}
+        self.env.read.return_value = [{'id': 1, 'name': 'bob'}]
+
+        self.assertRaises(
+            ValueError, self.manager.get, 1, include=['name'])
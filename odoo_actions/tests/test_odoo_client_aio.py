@@ -0,0 +1,22 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import sys
+
+# The asyncio client's tests use syntax Python 2 can't parse, so they're
+# kept in a module test discovery doesn't pick up, and only imported
+# here on Python 3.
+if sys.version_info >= (3, 5):
+    from odoo_actions.tests.aio_client_tests import (  # noqa: F401
+        AsyncOdooClientTests)
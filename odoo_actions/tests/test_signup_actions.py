@@ -24,10 +24,25 @@ from adjutant.common.tests.fake_clients import (
 from django.test import override_settings
 
 from odoo_actions.tests import (
-    odoo_cache, get_odoo_client, setup_odoo_cache, INDIVIDUAL_TAG_ID)
+    odoo_cache, get_odoo_client, setup_odoo_cache, INDIVIDUAL_TAG_ID,
+    FakePartnerManager, FakeRelationshipManager)
 from odoo_actions.signup import (
     NewClientSignUpAction, NewProjectSignUpAction)
 from odoo_actions.odoo_client import DEFAULT_PHYSICAL_ADDRESS_CONTACT_NAME
+from odoo_actions.odoo_client.common import BulkCreateError
+
+
+def fail_create(manager_class, **fields):
+    """Make creating records with 'fields' through 'manager_class'
+    fail."""
+    create = manager_class.create
+
+    def failing_create(self, **vals):
+        if all(vals.get(key) == value for key, value in fields.items()):
+            raise Exception("Create failed.")
+        return create(self, **vals)
+
+    return mock.patch.object(manager_class, 'create', failing_create)
 
 
 @mock.patch('odoo_actions.odoo_client.get_odoo_client', get_odoo_client)
@@ -209,6 +224,83 @@ class SignupActionTests(AdjutantTestCase):
         action.submit({})
         self.assertEquals(action.valid, True)
 
+    def test_new_customer_contact_fails(self):
+        """
+        One of the contacts fails to be created.
+
+        The others should be cached, and retrying should only create
+        the one which failed.
+        """
+        task = Task.objects.create(
+            ip_address="0.0.0.0",
+            keystone_user={})
+
+        data = {
+            'signup_type': 'organisation',
+            'name': 'jim james',
+            'email': 'jim@jim.jim',
+            'phone': '123456',
+            'payment_method': 'invoice',
+            'stripe_token': '',
+            'toc_agreed': 'true',
+            'news_agreed': 'true',
+            'company_name': 'Jim-co',
+            'address_1': "a street",
+            'address_2': "",
+            'city': 'some city',
+            'postal_code': 'NW1',
+            'country': 'NZ',
+            'primary_contact_is_billing': False,
+            'bill_name': 'Oz the Great and Powerful',
+            'bill_email': 'oz@em.oz',
+            'bill_phone': '123456',
+            'primary_address_is_billing': False,
+            'bill_address_1': 'yellow brick road',
+            'bill_address_2': '',
+            'bill_city': 'emerald city',
+            'bill_postal_code': 'NW1',
+            'bill_country': 'AU',
+            'discount_code': '',
+        }
+
+        action = NewClientSignUpAction(data, task=task, order=1)
+
+        action.pre_approve()
+        self.assertEquals(action.valid, True)
+
+        with fail_create(FakePartnerManager, name=data['bill_name']):
+            with self.assertRaises(BulkCreateError):
+                action.post_approve()
+
+        # The company, physical address and primary contact were created.
+        self.assertEquals(len(odoo_cache['partners']), 3)
+        partner_id = action.get_cache('partner_id')
+        physical_address_id = action.get_cache('physical_address_id')
+        primary_id = action.get_cache('primary_id')
+        self.assertEquals(
+            odoo_cache['partners'][physical_address_id]['name'],
+            DEFAULT_PHYSICAL_ADDRESS_CONTACT_NAME)
+        self.assertEquals(
+            odoo_cache['partners'][primary_id]['name'], data['name'])
+        self.assertEquals(action.get_cache('billing_id'), None)
+        self.assertTrue(any(
+            "Create failed." in note and "billing contact" in note
+            for note in action.action.task.action_notes[
+                str(action)]))
+
+        action.post_approve()
+        self.assertEquals(action.valid, True)
+        self.assertEquals(len(odoo_cache['partners']), 4)
+        self.assertEquals(action.get_cache('partner_id'), partner_id)
+        self.assertEquals(
+            action.get_cache('physical_address_id'), physical_address_id)
+        self.assertEquals(action.get_cache('primary_id'), primary_id)
+
+        billing_id = action.get_cache('billing_id')
+        self.assertEquals(
+            odoo_cache['partners'][billing_id]['name'], data['bill_name'])
+        self.assertEquals(action.action.task.cache['billing_id'], billing_id)
+
     def test_new_customer_duplicate(self):
         """
         Test the duplicate case, all valid.
@@ -605,3 +697,66 @@ class NewProjectSignUpActionTests(AdjutantTestCase):
             sorted(roles),
             sorted(['_member_', 'project_admin',
                     'project_mod', 'heat_stack_owner']))
+
+    def test_new_project_signup_relationship_fails(self):
+        """
+        One of the project's relationships fails to be created.
+
+        The others should be cached, and retrying should only create
+        the one which failed.
+        """
+
+        setup_identity_cache()
+
+        task = Task.objects.create(
+            ip_address="0.0.0.0",
+            keystone_user={}
+        )
+
+        task.cache = {
+            'project_name': 'test_project',
+            'partner_id': 1,
+            'primary_id': 2,
+            'billing_id': 3,
+        }
+
+        data = {
+            'domain_id': 'default',
+            'parent_id': None,
+            'email': 'test@example.com',
+            'signup_type': 'organisation',
+        }
+
+        action = NewProjectSignUpAction(data, task=task, order=1)
+
+        action.pre_approve()
+        self.assertEquals(action.valid, True)
+
+        with fail_create(FakeRelationshipManager, contact_type="primary"):
+            with self.assertRaises(BulkCreateError):
+                action.post_approve()
+
+        self.assertEquals(len(odoo_cache['projects']), 1)
+        self.assertEquals(len(odoo_cache['project_rels']), 2)
+        owner_rel = action.get_cache('owner_rel')
+        billing_rel = action.get_cache('billing_rel')
+        self.assertEquals(
+            odoo_cache['project_rels'][owner_rel]['partner_id'], 1)
+        self.assertEquals(
+            odoo_cache['project_rels'][billing_rel]['partner_id'], 3)
+        self.assertEquals(action.get_cache('primary_rel'), None)
+        self.assertEquals(action.get_cache('contacts_linked'), None)
+
+        action.post_approve()
+        self.assertEquals(action.valid, True)
+        self.assertEquals(len(odoo_cache['projects']), 1)
+        self.assertEquals(len(odoo_cache['project_rels']), 3)
+        self.assertEquals(action.get_cache('owner_rel'), owner_rel)
+        self.assertEquals(action.get_cache('billing_rel'), billing_rel)
+        primary_rel = action.get_cache('primary_rel')
+        self.assertEquals(
+            odoo_cache['project_rels'][primary_rel]['partner_id'], 2)
+        self.assertEquals(
+            odoo_cache['project_rels'][primary_rel]['contact_type'],
+            "primary")
+        self.assertEquals(action.get_cache('contacts_linked'), True)
@@ -0,0 +1,31 @@
+# Copyright (C) 2018 Catalyst IT Ltd
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from odoo_actions.odoo_client import identity_map
+
+
+class OdooIdentityMapMiddleware(object):
+    """Share Odoo records loaded during a request across that request.
+
+    Records looked up more than once while handling a request (e.g. the
+    project, by a decorator and then by the view) are only fetched once.
+    Nothing is kept between requests.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with identity_map.scope():
+            return self.get_response(request)
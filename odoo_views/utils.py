@@ -33,16 +33,16 @@ def not_reseller_customer(func, *args, **kwargs):
     odooclient = odoo_client.get_odoo_client()
 
     try:
-        odoo_project = odooclient.projects.list([
-            ('tenant_id', '=', project_id)], read=True)[0]
+        odoo_project_id = odooclient.projects.list([
+            ('tenant_id', '=', project_id)], get=False, limit=1)[0]
     except IndexError:
         return Response({'errors': ['Project not found']}, status=404)
 
-    reseller_customer_rels = odooclient.project_relationships.list([
-        ('cloud_tenant', '=', odoo_project['id']),
-        ('contact_type', '=', 'reseller customer')], read=True)
+    is_reseller_customer = odooclient.project_relationships.exists([
+        ('cloud_tenant', '=', odoo_project_id),
+        ('contact_type', '=', 'reseller customer')])
 
-    if reseller_customer_rels:
+    if is_reseller_customer:
         return Response(
             {'errors': ['Reseller customers cannot access this API.'],
              'is_reseller_customer': True},
@@ -86,12 +86,8 @@ class OpenStackSignUp(tasks.TaskView):
 
 
 def get_address_dict(odoo_owner):
-    odooclient = odoo_client.get_odoo_client()
-    if odoo_owner['country_id']:
-        country = odooclient.countries.get(
-            odoo_owner['country_id'][0], read=True)[0]
-    else:
-        country = {}
+    """Address of a partner read with its country_id included."""
+    country = odoo_owner['country_id'] or {}
     return {
         'address_1': odoo_owner['street'] or "",
         'address_2': odoo_owner['street2'] or "",
@@ -127,7 +123,7 @@ class AccountDetailsManagement(tasks.TaskView):
 
         try:
             odoo_project_id = odooclient.projects.list(
-                project_search, read=True)[0]['id']
+                project_search, get=False, limit=1)[0]
         except IndexError:
             return Response({'errors': ['Project not found']}, status=404)
 
@@ -135,9 +131,10 @@ class AccountDetailsManagement(tasks.TaskView):
             ("cloud_tenant", "=", odoo_project_id),
             ("contact_type", "=", "owner"),
         ]
-        owner_id = odooclient.project_relationships.list(
-            search, read=True)[0]['partner_id'][0]
-        owner = odooclient.partners.get(owner_id, read=True)[0]
+        # Reads the owner and their country along with the relationship.
+        owner = odooclient.project_relationships.list(
+            search, include=['partner_id', 'partner_id.country_id'],
+        )[0]['partner_id']
         address = get_address_dict(owner)
 
         account_type = 'organisation'
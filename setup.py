@@ -40,4 +40,7 @@ setup(
     keywords='Odoo erp contacts task adjutant workflow',
     packages=find_packages(),
     install_requires=required,
+    extras_require={
+        'async': ['aiohttp>=3.3; python_version >= "3.5"'],
+    },
 )